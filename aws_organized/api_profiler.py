@@ -0,0 +1,143 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+import contextlib
+import json
+import math
+import threading
+import time
+
+import click
+
+from aws_organized import rate_limiter
+
+STARTED = "api_profiler_started"
+
+# calls by service and operation name, None when the profiler is off
+profiles = None
+lock = threading.Lock()
+
+
+def start() -> None:
+    """
+    Turns the profiler on.  Clients made from now on, and passed to add_profiler, record their calls.
+    """
+    global profiles
+    profiles = dict()
+
+
+def get_profile(service_name: str, operation_name: str) -> dict:
+    return profiles.setdefault(
+        (service_name, operation_name), dict(latencies=list(), throttling_retries=0)
+    )
+
+
+def record_latency(service_name: str, operation_name: str, context: dict) -> None:
+    started = context.pop(STARTED, None)
+    if started is None:
+        return
+    latency = time.monotonic() - started
+    with lock:
+        get_profile(service_name, operation_name).get("latencies").append(latency)
+
+
+def add_profiler(client):
+    """
+    Records how long each call the client makes takes, including its retries, and how many times it was retried
+    because it was throttled.  Does nothing when the profiler is off.
+
+    :param client: boto3 or betterboto client
+    :return: the client
+    """
+    if profiles is None:
+        return client
+    service_name = client.meta.service_model.service_name
+
+    def before_call(context, **kwargs):
+        context[STARTED] = time.monotonic()
+
+    def after_call(model, context, **kwargs):
+        record_latency(service_name, model.name, context)
+
+    def after_call_error(event_name, context, **kwargs):
+        record_latency(service_name, event_name.split(".")[-1], context)
+
+    def needs_retry(operation, response=None, **kwargs):
+        if rate_limiter.is_throttled(response):
+            with lock:
+                get_profile(service_name, operation.name)["throttling_retries"] += 1
+
+    client.meta.events.register("before-call", before_call)
+    client.meta.events.register("after-call", after_call)
+    client.meta.events.register("after-call-error", after_call_error)
+    client.meta.events.register("needs-retry", needs_retry)
+    return client
+
+
+def get_percentile(sorted_latencies: list, percentile: int) -> float:
+    if len(sorted_latencies) == 0:
+        return 0.0
+    rank = math.ceil(percentile / 100 * len(sorted_latencies))
+    return sorted_latencies[max(rank, 1) - 1]
+
+
+def get_report() -> list:
+    """
+    Returns count, total, p50, p95 and max latency, in seconds, and throttling retries for each operation called,
+    slowest total first
+    """
+    report = list()
+    with lock:
+        for (service_name, operation_name), profile in profiles.items():
+            latencies = sorted(profile.get("latencies"))
+            report.append(
+                dict(
+                    service=service_name,
+                    operation=operation_name,
+                    count=len(latencies),
+                    total=sum(latencies),
+                    p50=get_percentile(latencies, 50),
+                    p95=get_percentile(latencies, 95),
+                    max=max(latencies, default=0.0),
+                    throttling_retries=profile.get("throttling_retries"),
+                )
+            )
+    return sorted(report, key=lambda operation: operation.get("total"), reverse=True)
+
+
+def finish(profile_api_out: str = None) -> None:
+    """
+    Writes the report as JSON to profile_api_out, or echoes it as a table if profile_api_out is None, and turns the
+    profiler off
+    """
+    global profiles
+    report = get_report()
+    profiles = None
+    if profile_api_out is not None:
+        with click.open_file(profile_api_out, "w") as f:
+            f.write(json.dumps(report, indent=2))
+        return
+    click.echo(
+        f"{'Operation':<48} {'Count':>6} {'Total':>9} {'p50':>8} {'p95':>8} {'Max':>8} {'Throttled':>9}"
+    )
+    for operation in report:
+        name = f"{operation.get('service')}.{operation.get('operation')}"
+        click.echo(
+            f"{name:<48} {operation.get('count'):>6} {operation.get('total'):>9.3f} "
+            f"{operation.get('p50'):>8.3f} {operation.get('p95'):>8.3f} {operation.get('max'):>8.3f} "
+            f"{operation.get('throttling_retries'):>9}"
+        )
+
+
+@contextlib.contextmanager
+def profiling(profile_api: bool, profile_api_out: str = None):
+    """
+    Profiles the API calls made while the block runs, unless profile_api is False
+    """
+    if not profile_api:
+        yield
+        return
+    start()
+    try:
+        yield
+    finally:
+        finish(profile_api_out)
@@ -0,0 +1,80 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+from typing import Callable
+
+from betterboto import client as betterboto_client
+from boto3.session import Session
+from botocore import credentials as botocore_credentials
+from botocore import session as botocore_session
+
+from aws_organized import api_profiler
+from aws_organized import metrics
+from aws_organized import rate_limiter
+
+
+def get_credentials_refresher(
+    role_arn: str, role_session_name: str
+) -> Callable[[], dict]:
+    sts = Session().client("sts")
+
+    def refresh() -> dict:
+        credentials = sts.assume_role(
+            RoleArn=role_arn,
+            RoleSessionName=role_session_name,
+        ).get("Credentials")
+        return dict(
+            access_key=credentials.get("AccessKeyId"),
+            secret_key=credentials.get("SecretAccessKey"),
+            token=credentials.get("SessionToken"),
+            expiry_time=credentials.get("Expiration").isoformat(),
+        )
+
+    return refresh
+
+
+class AssumedRoleCredentialProvider(botocore_credentials.CredentialProvider):
+    METHOD = "sts-assume-role"
+
+    def __init__(self, role_arn: str, role_session_name: str):
+        super().__init__()
+        self.refresh = get_credentials_refresher(role_arn, role_session_name)
+
+    def load(self) -> botocore_credentials.DeferredRefreshableCredentials:
+        return botocore_credentials.DeferredRefreshableCredentials(
+            refresh_using=self.refresh, method=self.METHOD
+        )
+
+
+def get_session(role_arn: str, role_session_name: str) -> Session:
+    """
+    Returns a session that assumes the role when it is first used and again shortly before the credentials expire.
+    Clients made from the session can be shared between threads and used for as long as the session is needed.
+
+    :param role_arn:
+    :param role_session_name: used for every assume role, so CloudTrail attributes the calls as before
+    :return: a boto3 session using the assumed role
+    """
+    session = botocore_session.get_session()
+    # the credential resolver is the supported way to give a botocore session its own credentials: it is asked for
+    # them once and botocore refreshes them from then on
+    session.register_component(
+        "credential_provider",
+        botocore_credentials.CredentialResolver(
+            providers=[AssumedRoleCredentialProvider(role_arn, role_session_name)]
+        ),
+    )
+    return Session(botocore_session=session)
+
+
+def get_client(session: Session, service_name: str, **kwargs):
+    """
+    Makes a client, with the betterboto helpers, the shared rate limiter, the metrics call counter and the API profiler,
+    from a session made by get_session.  kwargs are passed to Session.client, eg config.
+    """
+    client = betterboto_client.make_better(
+        service_name, session.client(service_name, **kwargs)
+    )
+    rate_limiter.add_rate_limiter(client)
+    metrics.add_call_counter(client)
+    api_profiler.add_profiler(client)
+    return client
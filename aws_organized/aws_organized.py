@@ -2,6 +2,8 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import os
+import hashlib
+import json
 
 from betterboto import client as betterboto_client
 
@@ -11,7 +13,22 @@ import yaml
 import click
 import logging
 import sys
+from concurrent import futures
+from typing import Tuple
 from aws_organized import migrations
+from aws_organized import api_profiler
+from aws_organized import assumed_role
+from aws_organized import environment_index
+from aws_organized import migration_writer
+from aws_organized import journal
+from aws_organized import ledger
+from aws_organized import metrics
+from aws_organized import migration_executor
+from aws_organized import migration_plan
+from aws_organized import ou_path_cache
+from aws_organized import preconditions
+from aws_organized import rate_limiter
+from aws_organized import state_store
 from aws_organized.extensions.service_control_policies import service_control_policies
 from aws_organized.extensions.delegated_administrators import delegated_administrators
 from datetime import datetime
@@ -20,14 +37,75 @@ from progress import bar
 
 logging.disable(sys.maxsize)
 
-STATE_FILE = "state.yaml"
 SERVICE_CONTROL_POLICY = "SERVICE_CONTROL_POLICY"
 ORGANIZATIONAL_UNIT = "ORGANIZATIONAL_UNIT"
+ACCOUNT = "ACCOUNT"
+ROOT = "ROOT"
 META_FILE_NAME = "_meta.yaml"
 SEP = os.path.sep
 
 EXTENSION = "aws_organized"
 
+# Organizations has low per account request rates, these keep the crawler within them: the pool is bounded, botocore's
+# standard retry mode retries throttled calls and the token bucket shared by the clients (see rate_limiter) slows them
+# all down as soon as one of them is throttled
+DEFAULT_MAX_WORKERS = 8
+
+# how the OUs below a parent are enumerated during import.  list_children needs a DescribeOrganizationalUnit call per
+# OU to get its Name and Arn, list_organizational_units_for_parent returns them for a whole page of OUs
+ENUMERATION_MODE_LIST_CHILDREN = "list_children"
+ENUMERATION_MODE_LIST_ORGANIZATIONAL_UNITS_FOR_PARENT = (
+    "list_organizational_units_for_parent"
+)
+ENUMERATION_MODES = [
+    ENUMERATION_MODE_LIST_CHILDREN,
+    ENUMERATION_MODE_LIST_ORGANIZATIONAL_UNITS_FOR_PARENT,
+]
+DEFAULT_ENUMERATION_MODE = ENUMERATION_MODE_LIST_ORGANIZATIONAL_UNITS_FOR_PARENT
+
+# how the crawler treats each parent.  FETCH lists its children and REUSE (used by incremental imports for the parents
+# the change feed does not mention) takes its children from the last import
+CRAWL_STRATEGY_FETCH = "FETCH"
+CRAWL_STRATEGY_REUSE = "REUSE"
+
+# CloudTrail events that change the OUs or accounts below a parent
+CHANGE_FEED_EVENTS = [
+    "CreateOrganizationalUnit",
+    "UpdateOrganizationalUnit",
+    "DeleteOrganizationalUnit",
+    "MoveAccount",
+    "CreateAccount",
+    "CreateGovCloudAccount",
+    "InviteAccountToOrganization",
+    "AcceptHandshake",
+    "RemoveAccountFromOrganization",
+    "CloseAccount",
+]
+# CloudTrail events that add accounts to the roots of the organization
+CHANGE_FEED_EVENTS_ADDING_ACCOUNTS = [
+    "CreateAccount",
+    "CreateGovCloudAccount",
+    "InviteAccountToOrganization",
+    "AcceptHandshake",
+]
+# CloudTrail events that change which policies are attached to which targets.  New OUs and accounts have
+# FullAWSAccess attached to them
+CHANGE_FEED_POLICY_EVENTS = [
+    "AttachPolicy",
+    "DetachPolicy",
+    "CreatePolicy",
+    "UpdatePolicy",
+    "DeletePolicy",
+    "CreateOrganizationalUnit",
+    "DeleteOrganizationalUnit",
+    "CreateAccount",
+    "CreateGovCloudAccount",
+    "InviteAccountToOrganization",
+    "AcceptHandshake",
+    "RemoveAccountFromOrganization",
+    "CloseAccount",
+]
+
 
 def list_policies_for_target(organizations: client, id: str, filter) -> dict:
     return organizations.list_policies_for_target(
@@ -49,107 +127,594 @@ def list_children(organizations: client, id: str, child_type: str) -> dict:
     ).get("Children", [])
 
 
-def get_service_control_policies_for_target(organizations: client, id: str) -> dict:
+def list_organizational_units_for_parent(organizations: client, id: str) -> list:
+    return organizations.list_organizational_units_for_parent_single_page(
+        ParentId=id,
+    ).get("OrganizationalUnits", [])
+
+
+def list_organizational_units(
+    organizations: client, id: str, enumeration_mode: str
+) -> list:
+    if enumeration_mode == ENUMERATION_MODE_LIST_CHILDREN:
+        return list_children(organizations, id, ORGANIZATIONAL_UNIT)
+    elif enumeration_mode == ENUMERATION_MODE_LIST_ORGANIZATIONAL_UNITS_FOR_PARENT:
+        return list_organizational_units_for_parent(organizations, id)
+    raise Exception(f"Unknown enumeration mode: {enumeration_mode}")
+
+
+def get_policy_attachment_index(
+    organizations: client, filter: str, max_workers: int = DEFAULT_MAX_WORKERS
+) -> dict:
+    """
+    Builds an index of which policies are attached to which targets.  There are far fewer policies than roots, OUs
+    and accounts so this makes one ListTargetsForPolicy call per policy (on a pool of max_workers threads) and
+    inverts the result instead of calling ListPoliciesForTarget for every target.
+
+    :param organizations:
+    :param filter: the policy type to index, eg SERVICE_CONTROL_POLICY
+    :param max_workers:
+    :return: dict with by_policy_id: {policy_id: {details, targets}} and by_target_id: {target_id: [policy]}
+    """
+    policies = organizations.list_policies_single_page(Filter=filter).get(
+        "Policies", []
+    )
+    with futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        targets_for_policies = list(
+            executor.map(
+                lambda policy: organizations.list_targets_for_policy_single_page(
+                    PolicyId=policy.get("Id")
+                ).get("Targets", []),
+                policies,
+            )
+        )
+    by_policy_id = dict()
+    for policy, targets in zip(policies, targets_for_policies):
+        by_policy_id[policy.get("Id")] = dict(details=policy, targets=targets)
+    return invert_policy_attachments(by_policy_id)
+
+
+def invert_policy_attachments(by_policy_id: dict) -> dict:
+    by_target_id = dict()
+    for policy in by_policy_id.values():
+        for target in policy.get("targets"):
+            by_target_id.setdefault(target.get("TargetId"), list()).append(
+                policy.get("details")
+            )
+    return dict(by_policy_id=by_policy_id, by_target_id=by_target_id)
+
+
+def list_policies_for_target_from_index(attachment_index: dict, id: str) -> list:
+    # copies are returned so yaml.safe_dump does not write anchors for policies shared between targets
+    return [dict(policy) for policy in attachment_index.get("by_target_id").get(id, [])]
+
+
+def get_service_control_policies_for_target(attachment_index: dict, id: str) -> dict:
     service_control_policies_for_target = dict()
-    for policy in list_policies_for_target(organizations, id, SERVICE_CONTROL_POLICY):
+    for policy in list_policies_for_target_from_index(attachment_index, id):
         service_control_policies_for_target[policy.get("Id")] = policy
     return service_control_policies_for_target
 
 
-def get_children_details_filter_by_organizational_unit(
-    organizations: client, id: str, by_name: dict, parent_path: str, by_id: dict
+def get_organizational_unit_details(
+    organizations: client, organizational_unit: dict, needs_describe: bool
+) -> dict:
+    if needs_describe:
+        return describe_organizational_unit(
+            organizations, organizational_unit.get("Id")
+        )
+    return organizational_unit
+
+
+def get_fingerprint(organizational_unit_ids: list, account_ids: list) -> str:
+    members = sorted(f"{ORGANIZATIONAL_UNIT}:{id}" for id in organizational_unit_ids)
+    members += sorted(f"{ACCOUNT}:{id}" for id in account_ids)
+    return hashlib.sha256("\n".join(members).encode("utf-8")).hexdigest()
+
+
+def get_crawl_strategy(id: str, previous: dict, dirty_ids: set) -> str:
+    if previous is None or dirty_ids is None:
+        return CRAWL_STRATEGY_FETCH
+    if id in dirty_ids:
+        return CRAWL_STRATEGY_FETCH
+    return CRAWL_STRATEGY_REUSE
+
+
+def get_previous_organizational_units(previous: dict) -> list:
+    return [
+        (organizational_unit.get("details"), False)
+        for organizational_unit in previous.get("organizational_units").values()
+    ]
+
+
+def list_children_of_parent(
+    organizations: client,
+    id: str,
+    enumeration_mode: str,
+    previous: dict = None,
+    strategy: str = CRAWL_STRATEGY_FETCH,
+) -> Tuple[list, list, str]:
+    """
+    Lists the OUs and accounts directly below the parent with the given id.
+
+    :param organizations:
+    :param id:
+    :param enumeration_mode: one of ENUMERATION_MODES
+    :param previous: the parent as recorded by the last import - its organizational_units, account_ids and fingerprint
+    :param strategy: one of the CRAWL_STRATEGY_ values
+    :return: a list of (ou, needs_describe) tuples, a list of accounts and the fingerprint of the parent's membership
+    """
+    if strategy == CRAWL_STRATEGY_REUSE:
+        return (
+            get_previous_organizational_units(previous),
+            [dict(Id=account_id) for account_id in previous.get("account_ids")],
+            previous.get("fingerprint"),
+        )
+
+    accounts = list_children(organizations, id, ACCOUNT)
+    account_ids = [account.get("Id") for account in accounts]
+    needs_describe = enumeration_mode == ENUMERATION_MODE_LIST_CHILDREN
+    children = list_organizational_units(organizations, id, enumeration_mode)
+    fingerprint = get_fingerprint([child.get("Id") for child in children], account_ids)
+    return [(child, needs_describe) for child in children], accounts, fingerprint
+
+
+def get_previous_account_ids_by_parent(previous_state: dict) -> dict:
+    account_ids_by_parent = dict()
+    if previous_state is None:
+        return account_ids_by_parent
+    for account_id, account in previous_state.get("accounts", {}).items():
+        for parent in account.get("parents", []):
+            account_ids_by_parent.setdefault(parent.get("Id"), list()).append(
+                account_id
+            )
+    return account_ids_by_parent
+
+
+def get_previous_parent(
+    previous_state: dict, id: str, node: dict, previous_account_ids: dict
+) -> dict:
+    if previous_state is None or node is None:
+        return None
+    return dict(
+        organizational_units=node.get("organizational_units", {}),
+        account_ids=previous_account_ids.get(id, []),
+        fingerprint=previous_state.get("fingerprints", {}).get(id),
+    )
+
+
+def crawl_organizational_units(
+    organizations: client,
+    root_id: str,
+    by_name: dict,
+    by_id: dict,
+    attachment_index: dict,
+    account_parents: dict,
+    fingerprints: dict,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    enumeration_mode: str = DEFAULT_ENUMERATION_MODE,
+    previous_state: dict = None,
+    dirty_ids: set = None,
 ) -> dict:
+    """
+    Walks the organizational units below root_id breadth first.  Each level of the tree is expanded on a pool of
+    max_workers threads: first the children of every parent on the level are listed and then the details of every
+    child are fetched.  The result has the same shape the depth first walk produced and by_name / by_id are filled
+    in as the tree is walked.  The accounts of each parent are listed at the same time and account_parents is
+    filled in with the same structure ListParents returns, so accounts do not need to be looked up one by one.
+
+    When previous_state and dirty_ids are given the walk is incremental: only the parents in dirty_ids are listed and
+    everything else is taken from previous_state.
+
+    :param organizations:
+    :param root_id:
+    :param by_name:
+    :param by_id:
+    :param attachment_index: built by get_policy_attachment_index
+    :param account_parents: account id to list of parents
+    :param fingerprints: parent id to the fingerprint of its membership
+    :param max_workers:
+    :param enumeration_mode: one of ENUMERATION_MODES
+    :param previous_state: the state written by the last import
+    :param dirty_ids: ids of the parents known to have changed since the last import
+    :return:
+    """
+    previous_account_ids = get_previous_account_ids_by_parent(previous_state)
+    previous_root = None
+    if previous_state is not None:
+        previous_root = get_previous_parent(
+            previous_state,
+            root_id,
+            previous_state.get("organizational_units").get("tree").get(root_id),
+            previous_account_ids,
+        )
     result = dict()
-    organizational_units = list_children(organizations, id, ORGANIZATIONAL_UNIT)
-    for organizational_unit in organizational_units:
-        organizational_unit_id = organizational_unit.get("Id")
+    level = [(root_id, "", result, previous_root)]
+    with futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while len(level) > 0:
+            children_for_level = executor.map(
+                lambda parent: list_children_of_parent(
+                    organizations,
+                    parent[0],
+                    enumeration_mode,
+                    parent[3],
+                    get_crawl_strategy(parent[0], parent[3], dirty_ids),
+                ),
+                level,
+            )
+            pending = list()
+            for (parent_id, parent_path, siblings, previous), listed in zip(
+                level, children_for_level
+            ):
+                children, accounts, fingerprint = listed
+                fingerprints[parent_id] = fingerprint
+                parent_type = ROOT if parent_id == root_id else ORGANIZATIONAL_UNIT
+                for account in accounts:
+                    account_parents[account.get("Id")] = [
+                        dict(Id=parent_id, Type=parent_type)
+                    ]
+                for child, needs_describe in children:
+                    previous_child = None
+                    if previous is not None:
+                        previous_child = previous.get("organizational_units").get(
+                            child.get("Id")
+                        )
+                    pending.append(
+                        (
+                            parent_id,
+                            parent_path,
+                            siblings,
+                            child,
+                            needs_describe,
+                            previous_child,
+                        )
+                    )
+
+            fetched_for_level = executor.map(
+                lambda child: get_organizational_unit_details(
+                    organizations, child[3], child[4]
+                ),
+                pending,
+            )
+            next_level = list()
+            for pending_child, details in zip(pending, fetched_for_level):
+                parent_id, parent_path, siblings, child = pending_child[0:4]
+                previous_child = pending_child[5]
+                organizational_unit_id = child.get("Id")
+                path = parent_path + "/" + details.get("Name")
+                by_name[path] = details.get("Id")
+                by_id[details.get("Id")] = dict(path=path, details=details)
+
+                organizational_units = dict()
+                siblings[organizational_unit_id] = dict(
+                    details=details,
+                    parent_id=parent_id,
+                    policies=dict(
+                        service_control_policies=get_service_control_policies_for_target(
+                            attachment_index, organizational_unit_id
+                        ),
+                    ),
+                    organizational_units=organizational_units,
+                )
+                next_level.append(
+                    (
+                        organizational_unit_id,
+                        path,
+                        organizational_units,
+                        get_previous_parent(
+                            previous_state,
+                            organizational_unit_id,
+                            previous_child,
+                            previous_account_ids,
+                        ),
+                    )
+                )
+            level = next_level
+    return result
+
+
+def read_change_feed(change_feed: str) -> list:
+    """
+    Reads CloudTrail records from a CloudTrail log file ({"Records": [...]}) or from a file with one record per line
+    """
+    content = open(change_feed, "r").read()
+    try:
+        records = json.loads(content)
+    except json.JSONDecodeError:
+        return [json.loads(line) for line in content.splitlines() if line.strip()]
+    if isinstance(records, dict):
+        return records.get("Records", [records])
+    return records
+
+
+def get_previous_parent_ids(previous_state: dict) -> dict:
+    parent_ids = dict()
+    for account_id, account in previous_state.get("accounts", {}).items():
+        for parent in account.get("parents", []):
+            parent_ids[account_id] = parent.get("Id")
+    nodes = list(previous_state.get("organizational_units").get("tree").values())
+    while len(nodes) > 0:
+        node = nodes.pop()
+        for child_id, child in node.get("organizational_units", {}).items():
+            parent_ids[child_id] = child.get("parent_id")
+            nodes.append(child)
+    return parent_ids
+
+
+def get_changes_from_change_feed(change_feed: str, previous_state: dict) -> dict:
+    """
+    Replays the CloudTrail records in change_feed against the state written by the last import.
+
+    :param change_feed: path to the file of CloudTrail records
+    :param previous_state:
+    :return: dict with the parent_ids and account_ids that changed and whether policy attachments changed
+    """
+    previous_parent_ids = get_previous_parent_ids(previous_state)
+    root_ids = list(previous_state.get("organizational_units").get("tree").keys())
+    parent_ids = set()
+    account_ids = set()
+    policies_changed = False
+    for record in read_change_feed(change_feed):
+        event_name = record.get("eventName")
+        if record.get("errorCode") is not None:
+            continue
+        if event_name in CHANGE_FEED_POLICY_EVENTS:
+            policies_changed = True
+        if event_name not in CHANGE_FEED_EVENTS:
+            continue
+        parameters = record.get("requestParameters") or dict()
+        for key in ["parentId", "sourceParentId", "destinationParentId"]:
+            if parameters.get(key) is not None:
+                parent_ids.add(parameters.get(key))
+        for key in ["organizationalUnitId", "accountId"]:
+            if previous_parent_ids.get(parameters.get(key)) is not None:
+                parent_ids.add(previous_parent_ids.get(parameters.get(key)))
+        if parameters.get("accountId") is not None:
+            account_ids.add(parameters.get("accountId"))
+        if event_name in CHANGE_FEED_EVENTS_ADDING_ACCOUNTS:
+            parent_ids.update(root_ids)
+    return dict(
+        parent_ids=parent_ids,
+        account_ids=account_ids,
+        policies_changed=policies_changed,
+    )
 
-        details = describe_organizational_unit(organizations, organizational_unit_id)
-        path = parent_path + "/" + details.get("Name")
-        by_name[path] = details.get("Id")
-        by_id[details.get("Id")] = dict(path=path, details=details)
 
-        result[organizational_unit_id] = dict(
+def get_account_details(
+    organizations: client,
+    account_ids: list,
+    previous_state: dict,
+    dirty_account_ids: set,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+) -> list:
+    """
+    Returns the details of the given accounts, reusing the details recorded by the last import and only calling
+    DescribeAccount for new accounts or accounts known to have changed (see get_dirty_account_ids).
+    """
+    previous_accounts = previous_state.get("accounts", {})
+
+    def get_details(account_id: str) -> dict:
+        if account_id in previous_accounts and account_id not in dirty_account_ids:
+            return previous_accounts.get(account_id).get("details")
+        return organizations.describe_account(AccountId=account_id).get("Account")
+
+    with futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(get_details, account_ids))
+
+
+def get_dirty_account_ids(
+    previous_state: dict,
+    dirty_account_ids: set,
+    account_parents: dict,
+    fingerprints: dict,
+) -> set:
+    """
+    Returns the accounts whose details may have changed since the last import: the accounts in the change feed and
+    the accounts below a parent whose membership changed
+    """
+    previous_fingerprints = previous_state.get("fingerprints", {})
+    changed_parent_ids = {
+        parent_id
+        for parent_id, fingerprint in fingerprints.items()
+        if previous_fingerprints.get(parent_id) != fingerprint
+    }
+    return dirty_account_ids.union(
+        account_id
+        for account_id, parents in account_parents.items()
+        if any(parent.get("Id") in changed_parent_ids for parent in parents)
+    )
+
+
+def refresh_policy_target_names(
+    attachment_index: dict, by_id: dict, accounts: dict
+) -> None:
+    """
+    Gives the targets in an attachment index reused from the last import the names found by this import, as OUs and
+    accounts may have been renamed since
+    """
+    for policy in attachment_index.get("by_policy_id").values():
+        targets = list()
+        for target in policy.get("targets"):
+            target_id = target.get("TargetId")
+            details = None
+            if target_id in by_id:
+                details = by_id.get(target_id).get("details")
+            elif target_id in accounts:
+                details = accounts.get(target_id).get("details")
+            target = dict(target)
+            if details is not None:
+                target["Name"] = details.get("Name")
+            targets.append(target)
+        policy["targets"] = targets
+
+
+def get_state(
+    organizations: client,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    enumeration_mode: str = DEFAULT_ENUMERATION_MODE,
+    previous_state: dict = None,
+    dirty_ids: set = None,
+    dirty_account_ids: set = None,
+    policies_changed: bool = True,
+) -> dict:
+    """
+    Crawls the organization and returns the accounts, OUs and SCP attachments in it.  When previous_state is given
+    the parts of it that have not changed are reused (see update_state).
+    """
+    if dirty_account_ids is None:
+        dirty_account_ids = set()
+    all_accounts = dict()
+    account_parents = dict()
+    fingerprints = dict()
+    result = dict(
+        accounts=all_accounts,
+        enumeration_mode=enumeration_mode,
+        fingerprints=fingerprints,
+    )
+    if (
+        previous_state is not None
+        and not policies_changed
+        and previous_state.get("service_control_policies") is not None
+    ):
+        attachment_index = invert_policy_attachments(
+            previous_state.get("service_control_policies")
+        )
+        attachment_index_reused = True
+    else:
+        attachment_index = get_policy_attachment_index(
+            organizations, SERVICE_CONTROL_POLICY, max_workers
+        )
+        attachment_index_reused = False
+    result["service_control_policies"] = attachment_index.get("by_policy_id")
+    list_roots_response = organizations.list_roots_single_page()
+    tree = dict()
+    by_name = dict()
+    by_id = dict()
+    organizational_units = dict(tree=tree, by_name=by_name, by_id=by_id)
+    result["organizational_units"] = organizational_units
+    progress = bar.IncrementalBar(
+        "Adding roots", max=len(list_roots_response.get("Roots", []))
+    )
+    for root in list_roots_response.get("Roots", []):
+        progress.next()
+        root_id = str(root.get("Id"))
+        details = dict(
+            Type="Root",
+            Id=root_id,
+            Name="Root",
+        )
+        by_name["/"] = root_id
+        by_id[root_id] = dict(path="/", details=details)
+        tree[root_id] = dict(
             details=details,
-            parent_id=id,
+            organizational_units=crawl_organizational_units(
+                organizations,
+                root_id,
+                by_name,
+                by_id,
+                attachment_index,
+                account_parents,
+                fingerprints,
+                max_workers,
+                enumeration_mode,
+                previous_state,
+                dirty_ids,
+            ),
             policies=dict(
-                service_control_policies=get_service_control_policies_for_target(
-                    organizations, organizational_unit_id
+                service_control_policies=list_policies_for_target_from_index(
+                    attachment_index, root_id
                 ),
             ),
-            organizational_units=get_children_details_filter_by_organizational_unit(
-                organizations, organizational_unit_id, by_name, path, by_id
+        )
+    progress.finish()
+
+    if previous_state is None or dirty_ids is None:
+        accounts = organizations.list_accounts_single_page().get("Accounts", [])
+    else:
+        accounts = get_account_details(
+            organizations,
+            list(account_parents.keys()),
+            previous_state,
+            get_dirty_account_ids(
+                previous_state, dirty_account_ids, account_parents, fingerprints
+            ),
+            max_workers,
+        )
+    progress = bar.IncrementalBar("Adding accounts", max=len(accounts))
+    counter = 1
+    for account in accounts:
+        progress.next()
+        account_id = account.get("Id")
+        parents = account_parents.get(account_id)
+        if parents is None:
+            # the account was moved or created while the tree was being crawled
+            parents = organizations.list_parents_single_page(ChildId=account_id).get(
+                "Parents"
+            )
+        all_accounts[account_id] = dict(
+            details=account,
+            parents=parents,
+            policies=dict(
+                service_control_policies=list_policies_for_target_from_index(
+                    attachment_index, account_id
+                ),
             ),
         )
+        counter += 1
+    progress.finish()
+    if attachment_index_reused:
+        refresh_policy_target_names(attachment_index, by_id, all_accounts)
     return result
 
 
-def update_state(role_arn) -> None:
+def update_state(
+    role_arn,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    enumeration_mode: str = DEFAULT_ENUMERATION_MODE,
+    incremental: bool = False,
+    change_feed: str = None,
+    state_format: str = state_store.DEFAULT_STATE_FORMAT,
+) -> dict:
+    previous_state = None
+    dirty_ids = None
+    dirty_account_ids = set()
+    policies_changed = True
+    if incremental:
+        if change_feed is None:
+            raise Exception("Incremental imports need a change feed")
+        previous_state = state_store.read_state(state_format)
+        if previous_state is None:
+            click.echo(
+                f"No {state_store.get_state_file(state_format)} found, importing the whole organization"
+            )
+        else:
+            changes = get_changes_from_change_feed(change_feed, previous_state)
+            dirty_ids = changes.get("parent_ids")
+            dirty_account_ids = changes.get("account_ids")
+            policies_changed = changes.get("policies_changed")
+
     with betterboto_client.CrossAccountClientContextManager(
         "organizations",
         role_arn,
         f"organizations",
+        config=rate_limiter.get_client_config(max_workers),
     ) as organizations:
-        all_accounts = dict()
-        result = dict(accounts=all_accounts)
-        list_roots_response = organizations.list_roots_single_page()
-        tree = dict()
-        by_name = dict()
-        by_id = dict()
-        organizational_units = dict(tree=tree, by_name=by_name, by_id=by_id)
-        result["organizational_units"] = organizational_units
-        progress = bar.IncrementalBar(
-            "Adding roots", max=len(list_roots_response.get("Roots", []))
+        rate_limiter.add_rate_limiter(organizations)
+        metrics.add_call_counter(organizations)
+        api_profiler.add_profiler(organizations)
+        result = get_state(
+            organizations,
+            max_workers,
+            enumeration_mode,
+            previous_state,
+            dirty_ids,
+            dirty_account_ids,
+            policies_changed,
         )
-        for root in list_roots_response.get("Roots", []):
-            progress.next()
-            root_id = str(root.get("Id"))
-            details = dict(
-                Type="Root",
-                Id=root_id,
-                Name="Root",
-            )
-            by_name["/"] = root_id
-            by_id[root_id] = dict(path="/", details=details)
-            tree[root_id] = dict(
-                details=details,
-                organizational_units=get_children_details_filter_by_organizational_unit(
-                    organizations, root_id, by_name, "", by_id
-                ),
-                policies=dict(
-                    service_control_policies=organizations.list_policies_for_target(
-                        TargetId=root_id,
-                        Filter=SERVICE_CONTROL_POLICY,
-                    ).get("Policies", []),
-                ),
-            )
-        progress.finish()
-
-        with open(STATE_FILE, "w") as f:
-            f.write(yaml.safe_dump(result))
-
-        accounts = organizations.list_accounts_single_page().get("Accounts", [])
-        progress = bar.IncrementalBar("Adding accounts", max=len(accounts))
-        counter = 1
-        for account in accounts:
-            progress.next()
-            account_id = account.get("Id")
-            all_accounts[account_id] = dict(
-                details=account,
-                parents=organizations.list_parents_single_page(ChildId=account_id).get(
-                    "Parents"
-                ),
-                policies=dict(
-                    service_control_policies=organizations.list_policies_for_target(
-                        TargetId=account_id,
-                        Filter=SERVICE_CONTROL_POLICY,
-                    ).get("Policies", []),
-                ),
-            )
-            counter += 1
-        progress.finish()
-        with open(STATE_FILE, "w") as f:
-            f.write(yaml.safe_dump(result))
+        add_snapshot_details(
+            organizations, result, max_workers, previous_state, policies_changed
+        )
+        state_store.write_state(result, state_format)
         return result
 
 
@@ -178,9 +743,29 @@ def write_organizational_units(unit: dict, output_dir: str) -> None:
         )
 
 
-def import_organization(role_arn: str, root_id: str) -> None:
-    update_state(role_arn)
-    state = yaml.safe_load(open(STATE_FILE, "r").read())
+def import_organization(
+    role_arn: str,
+    root_id: str,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    enumeration_mode: str = DEFAULT_ENUMERATION_MODE,
+    incremental: bool = False,
+    change_feed: str = None,
+    state_format: str = state_store.DEFAULT_STATE_FORMAT,
+) -> dict:
+    """
+    Updates the state and writes the root, OUs and accounts below root_id to the environment
+
+    :return: the state, so the extensions can import from it without reading it again
+    """
+    with metrics.phase(metrics.UPDATE_STATE):
+        state = update_state(
+            role_arn,
+            max_workers,
+            enumeration_mode,
+            incremental,
+            change_feed,
+            state_format,
+        )
     output_dir = "environment"
     organizational_units = state.get("organizational_units").get("tree")
     by_id = state.get("organizational_units").get("by_id")
@@ -216,64 +801,138 @@ def import_organization(role_arn: str, root_id: str) -> None:
             "w",
         ) as f:
             f.write(yaml.safe_dump(account_details))
+    return state
 
 
 def write_migration(
     extension: str, root_id: str, migration_type: str, migration_params: dict
 ) -> None:
-    now = datetime.now()
-    timestamp = datetime.timestamp(now)
-    migration_file_name = f"{timestamp}_{migration_type}.yaml"
-    os.makedirs(
-        SEP.join(["environment", root_id, "_migrations"]),
-        exist_ok=True,
+    migration_writer.write_migration(
+        extension, root_id, migration_type, migration_params
     )
-    with open(
-        SEP.join(["environment", root_id, "_migrations", migration_file_name]), "w"
-    ) as f:
-        f.write(
-            yaml.safe_dump(
-                dict(
-                    extension=extension,
-                    migration_type=migration_type,
-                    migration_params=migration_params,
-                )
-            )
+
+
+def add_snapshot_details(
+    organizations: client,
+    state: dict,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    previous_state: dict = None,
+    policies_changed: bool = True,
+) -> None:
+    """
+    Adds the details make-migrations needs, on top of what get_state returns, to the state:
+      - service_control_policy_contents - the Content of each SCP by policy Id
+      - delegated_administrators - the DelegatedServices of each delegated administrator by account Id
+
+    Each part is fetched using a pool of max_workers threads.  The policy contents of the previous_state are reused
+    when policies have not changed.
+    """
+    if (
+        previous_state is not None
+        and not policies_changed
+        and previous_state.get("service_control_policy_contents") is not None
+    ):
+        policy_contents = previous_state.get("service_control_policy_contents")
+    else:
+        policy_contents = service_control_policies.get_policy_contents(
+            organizations, state.get("service_control_policies"), max_workers
         )
+    delegated_services = delegated_administrators.get_delegated_services(
+        organizations, max_workers
+    )
+    state["service_control_policy_contents"] = policy_contents
+    state["delegated_administrators"] = delegated_services
+
 
+def get_remote_snapshot(role_arn: str, max_workers: int = DEFAULT_MAX_WORKERS) -> dict:
+    """
+    Takes a snapshot of the organization for make-migrations to compare the environment against.  The snapshot is the
+    state import-organization writes, see add_snapshot_details.
 
-def make_migrations(role_arn: str, root_id: str) -> None:
+    :param role_arn:
+    :param max_workers:
+    :return: the snapshot
+    """
     with betterboto_client.CrossAccountClientContextManager(
         "organizations",
         role_arn,
         f"organizations",
-    ) as orgs_client:
-        progress = bar.IncrementalBar("Making migrations", max=2)
-        progress.next()
-        make_migrations_for_organizational_units(orgs_client, root_id)
-        progress.next()
-        make_migrations_for_accounts(orgs_client, root_id)
-        progress.finish()
+        config=rate_limiter.get_client_config(max_workers),
+    ) as organizations:
+        rate_limiter.add_rate_limiter(organizations)
+        metrics.add_call_counter(organizations)
+        api_profiler.add_profiler(organizations)
+        snapshot = get_state(organizations, max_workers)
+        add_snapshot_details(organizations, snapshot, max_workers)
+        return snapshot
+
 
+def read_snapshot(snapshot_file: str) -> dict:
+    """
+    Reads a snapshot saved by import-organization (state.yaml, state.json or state.msgpack) so make-migrations can be
+    run without calling AWS
 
-def make_migrations_for_accounts(organizations, root_id: str) -> None:
+    :param snapshot_file: the path to the snapshot, its format is taken from its extension
+    :return: the snapshot
+    """
+    state_format = state_store.get_state_format_for_file(snapshot_file)
+    snapshot = state_store.read_state_file(snapshot_file, state_format)
+    if snapshot is None:
+        raise Exception(f"{snapshot_file} does not exist")
+    for key in ["service_control_policy_contents", "delegated_administrators"]:
+        if snapshot.get(key) is None:
+            raise Exception(
+                f"{snapshot_file} has no {key}, run import-organization again to save a full snapshot"
+            )
+    return snapshot
+
+
+def make_migrations(root_id: str, snapshot: dict, index: dict = None) -> None:
+    if index is None:
+        index = environment_index.build_index(root_id)
+    progress = bar.IncrementalBar("Making migrations", max=2)
+    progress.next()
+    with metrics.phase(
+        metrics.MAKE_MIGRATIONS_CHECK,
+        root_id=root_id,
+        check="make_migrations_for_organizational_units",
+    ):
+        make_migrations_for_organizational_units(snapshot, root_id, index)
+    progress.next()
+    with metrics.phase(
+        metrics.MAKE_MIGRATIONS_CHECK,
+        root_id=root_id,
+        check="make_migrations_for_accounts",
+    ):
+        make_migrations_for_accounts(snapshot, root_id, index)
+    progress.finish()
+
+
+def make_migrations_for_accounts(
+    snapshot: dict, root_id: str, index: dict = None
+) -> None:
     """
     Creates migrations for the following account use cases:
       - move an account
       - - when the remote parent ou exists - ACCOUNT_MOVE
       - - when the remote parent ou does not exist - ACCOUNT_MOVE_WITH_NON_EXISTENT_PARENT_OU
-    :param organizations:
+    :param snapshot: taken by get_remote_snapshot
+    :param index: built by environment_index.build_index
     :return:
     """
-    accounts = get_accounts_folders()
-    for account_file_path in accounts:
-        account_name = account_file_path.split(SEP)[-1]
-        account_details = yaml.safe_load(
-            open(f"{account_file_path}{SEP}{META_FILE_NAME}", "r").read()
-        )
-        list_parents_single_page_response = organizations.list_parents_single_page(
-            ChildId=account_details.get("Id")
-        ).get("Parents")
+    if index is None:
+        index = environment_index.build_index(root_id)
+    for account in environment_index.get_entities(index, environment_index.ACCOUNT):
+        account_file_path = account.get("path")
+        account_details = account.get("meta")
+        if account_details is None:
+            raise Exception(f"{account_file_path} has no {META_FILE_NAME}")
+        remote_account = snapshot.get("accounts").get(account_details.get("Id"))
+        if remote_account is None:
+            raise Exception(
+                f"{account_details.get('Id')} was not found in the organization"
+            )
+        list_parents_single_page_response = remote_account.get("parents")
         if len(list_parents_single_page_response) != 1:
             raise Exception(
                 f"{account_details.get('Id')} has {len(list_parents_single_page_response)} parents."
@@ -285,12 +944,12 @@ def make_migrations_for_accounts(organizations, root_id: str) -> None:
         parent_ou_path_details_file_path = SEP.join(
             account_file_path.split(SEP)[0:-2] + [META_FILE_NAME]
         )
+        local_parent_ou = environment_index.get_parent(index, account)
 
-        if os.path.exists(parent_ou_path_details_file_path):
-            local_parent_ou_details = yaml.safe_load(
-                open(parent_ou_path_details_file_path, "r").read()
+        if local_parent_ou is not None and local_parent_ou.get("meta") is not None:
+            local_parent_organizational_unit_ou_id = environment_index.get_id(
+                local_parent_ou
             )
-            local_parent_organizational_unit_ou_id = local_parent_ou_details.get("Id")
 
             if (
                 local_parent_organizational_unit_ou_id
@@ -322,18 +981,9 @@ def make_migrations_for_accounts(organizations, root_id: str) -> None:
             )
 
 
-def get_parent_ou_id_for_details_file(details_file_path: str) -> str:
-    parent_path = SEP.join(details_file_path.split(SEP)[0:-2])
-    if os.path.exists(f"{parent_path}{SEP}{META_FILE_NAME}"):
-        parent_details = yaml.safe_load(
-            open(f"{parent_path}{SEP}{META_FILE_NAME}", "r").read()
-        )
-        if parent_details.get("Id"):
-            return parent_details.get("Id")
-    return None
-
-
-def make_migrations_for_organizational_units(organizations, root_id: str) -> None:
+def make_migrations_for_organizational_units(
+    snapshot: dict, root_id: str, index: dict = None
+) -> None:
     """
     Creates migrations for the following OU use cases:
       - add an ou
@@ -352,25 +1002,27 @@ def make_migrations_for_organizational_units(organizations, root_id: str) -> Non
       - - where there is already a remote parent ou
       - - where there is not already a remote parent ou
 
-    :param organizations:
+    :param snapshot: taken by get_remote_snapshot
+    :param index: built by environment_index.build_index
     :return:
     """
-    organizational_units_folders = get_organizational_units_folders()
-    for organizational_unit_folder in organizational_units_folders:
-        if os.path.exists(SEP.join([organizational_unit_folder, META_FILE_NAME])):
-            details = yaml.safe_load(
-                open(
-                    SEP.join([organizational_unit_folder, META_FILE_NAME]),
-                    "r",
-                ).read()
+    if index is None:
+        index = environment_index.build_index(root_id)
+    remote_organizational_units = snapshot.get("organizational_units").get("by_id")
+    for organizational_unit in environment_index.get_entities(
+        index, environment_index.ORGANIZATIONAL_UNIT
+    ):
+        organizational_unit_folder = organizational_unit.get("path")
+        if organizational_unit.get("meta") is not None:
+            details = organizational_unit.get("meta")
+            remote_organizational_unit = remote_organizational_units.get(
+                details.get("Id")
             )
-            remote_name = (
-                organizations.describe_organizational_unit(
-                    OrganizationalUnitId=details.get("Id")
+            if remote_organizational_unit is None:
+                raise Exception(
+                    f"{details.get('Id')} was not found in the organization"
                 )
-                .get("OrganizationalUnit")
-                .get("Name")
-            )
+            remote_name = remote_organizational_unit.get("details").get("Name")
 
             local_name = organizational_unit_folder.split(SEP)[-1]
             if remote_name != local_name:
@@ -389,15 +1041,14 @@ def make_migrations_for_organizational_units(organizations, root_id: str) -> Non
                 organizational_unit_folder.split(SEP)[0:-2]
             )
             new_ou_name = organizational_unit_folder.split(SEP)[-1]
-            if os.path.exists(
-                SEP.join([parent_organizational_unit_folder, META_FILE_NAME])
+            parent_organizational_unit = environment_index.get_parent(
+                index, organizational_unit
+            )
+            if (
+                parent_organizational_unit is not None
+                and parent_organizational_unit.get("meta") is not None
             ):
-                parent_id = yaml.safe_load(
-                    open(
-                        SEP.join([parent_organizational_unit_folder, META_FILE_NAME]),
-                        "r",
-                    ).read()
-                ).get("Id")
+                parent_id = environment_index.get_id(parent_organizational_unit)
                 write_migration(
                     EXTENSION,
                     root_id,
@@ -433,76 +1084,291 @@ def get_accounts_folders() -> list:
     return [x[0] for x in os.walk("environment/") if x[0].split(SEP)[-2] == "_accounts"]
 
 
-def migrate(root_id: str, role_arn: str, ssm_parameter_prefix: str) -> None:
-    with betterboto_client.CrossAccountClientContextManager(
-        "ssm",
-        role_arn,
-        f"ssm",
-    ) as ssm:
-        progress = bar.IncrementalBar(
-            "Migrating", max=len(os.listdir(f"environment/{root_id}/_migrations"))
+def get_migration_function(migration_extension: str, migration_type: str):
+    if migration_extension == EXTENSION:
+        return migrations.get_function(migration_type)
+    elif migration_extension == service_control_policies.EXTENSION:
+        return service_control_policies.migrations.get_function(migration_type)
+    elif migration_extension == delegated_administrators.EXTENSION:
+        return delegated_administrators.migrations.get_function(migration_type)
+    else:
+        raise Exception(f"Unknown extension: {migration_extension}")
+
+
+def run_migration(
+    root_id: str, organizations, migration: dict, snapshot: dict = None
+) -> Tuple[bool, str]:
+    """
+    Runs the migration.  When a snapshot (see preconditions.make_snapshot) is given the migration is first checked
+    against it and is not run if the change it makes is already in place.  The migration fails without being run if
+    the check fails, eg because the role cannot read the organization.
+    """
+    migration_function = get_migration_function(
+        migration.get("extension"), migration.get("migration_type")
+    )
+    if snapshot is not None:
+        try:
+            already_applied = preconditions.is_already_applied(
+                organizations, snapshot, migration
+            )
+        except Exception as ex:
+            if not preconditions.is_not_found(ex):
+                return False, f"Could not check the preconditions: {ex}"
+            already_applied = False
+        if already_applied:
+            return True, preconditions.ALREADY_APPLIED
+    try:
+        return migration_function(
+            root_id, organizations, **migration.get("migration_params")
         )
-        for migration_file in sorted(os.listdir(f"environment/{root_id}/_migrations")):
-            progress.next()
-            migration_id = migration_file.split(SEP)[-1].replace(".yaml", "")
+    except Exception as ex:
+        return False, "Unhandled error: {0}".format(ex)
+    finally:
+        if snapshot is not None:
+            preconditions.forget_changed(snapshot, migration)
 
-            try:
-                ssm.get_parameter(
-                    Name=f"{ssm_parameter_prefix}/migrations/{migration_id}"
-                )
-                click.echo(f" Migration: {migration_id} already run")
-            except ssm.exceptions.ParameterNotFound:
-                # click.echo(
-                #     f" Record of migration: {migration_id} being run not found, running now"
-                # )
-                migration = yaml.safe_load(
-                    open(
-                        f"environment/{root_id}/_migrations/{migration_file}", "r"
-                    ).read()
-                )
-                migration_extension = migration.get("extension")
-                migration_type = migration.get("migration_type")
-                migration_params = migration.get("migration_params")
-
-                if migration_extension == EXTENSION:
-                    migration_function = migrations.get_function(migration_type)
-                elif migration_extension == service_control_policies.EXTENSION:
-                    migration_function = (
-                        service_control_policies.migrations.get_function(migration_type)
-                    )
-                elif migration_extension == delegated_administrators.EXTENSION:
-                    migration_function = (
-                        delegated_administrators.migrations.get_function(migration_type)
-                    )
-                else:
-                    raise Exception(f"Unknown extension: {migration_extension}")
-
-                try:
-
-                    with betterboto_client.CrossAccountClientContextManager(
-                        "organizations",
-                        role_arn=role_arn,
-                        role_session_name="ou_create",
-                    ) as client:
-                        result, message = migration_function(
-                            root_id, client, **migration_params
-                        )
-                except Exception as ex:
-                    result = False
-                    message = "Unhandled error: {0}".format(ex)
-
-                status = "Ok" if result else "FAILED"
-                click.echo(f"{migration_id}: {status} - {message}")
-                ssm.put_parameter(
-                    Name=f"{ssm_parameter_prefix}/migrations/{migration_id}",
-                    Description=f"Migration run: {datetime.utcnow()}",
-                    Value=status if result else f"{status}: {message}",
-                    Type="String",
-                    Tags=[
-                        {"Key": "AWS-Organized:Actor", "Value": "Framework"},
-                    ],
+
+def get_migrations_to_run(
+    root_id: str, applied_migration_ids: set
+) -> Tuple[list, list]:
+    """
+    Reads the migrations in the _migrations directory that are not in applied_migration_ids, checking each can be run.
+    The migrations are read from the manifest when make-migrations wrote one and it is still up to date.
+
+    :param root_id:
+    :param applied_migration_ids: read from the ledger
+    :return: (migrations to run in the order they were made, ids of the migrations already run)
+    """
+    migrations_to_run = list()
+    migration_ids_already_run = list()
+    manifest = migration_writer.read_manifest(root_id)
+    for migration_id in migration_writer.get_migration_ids(root_id):
+        if migration_id in applied_migration_ids:
+            migration_ids_already_run.append(migration_id)
+        else:
+            if manifest is not None:
+                migration = migration_writer.get_migration_from_manifest(
+                    manifest, migration_id
                 )
-        progress.finish()
+            else:
+                migration = migration_writer.read_migration(root_id, migration_id)
+            get_migration_function(
+                migration.get("extension"), migration.get("migration_type")
+            )
+            migration["migration_id"] = migration_id
+            migrations_to_run.append(migration)
+    return migrations_to_run, migration_ids_already_run
+
+
+def migrate(
+    root_id: str,
+    role_arn: str,
+    ssm_parameter_prefix: str,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    ledger_type: str = ledger.DEFAULT_LEDGER,
+    ledger_file: str = ledger.DEFAULT_LEDGER_FILE,
+    ledger_table: str = ledger.DEFAULT_LEDGER_TABLE,
+    ledger_endpoint_url: str = None,
+    state_format: str = state_store.DEFAULT_STATE_FORMAT,
+    check_preconditions: bool = True,
+    journal_file: str = journal.DEFAULT_JOURNAL_FILE,
+    deadline: float = None,
+) -> bool:
+    """
+    Runs the migrations that have not been run yet.  Migrations that do not depend on each other (see
+    migration_executor.get_dependencies) are run at the same time using a pool of max_workers threads.  The role is
+    assumed once and the same clients are used for every migration.  The migrations already run are read from, and
+    each migration run is recorded in, the ledger named by ledger_type (see ledger.get_ledger).  The paths of OUs are
+    resolved using a cache seeded from the state written by import-organization (see ou_path_cache).  When
+    check_preconditions is set migrations whose change is already in place are recorded as run without being run.
+
+    Unless journal_file is None the migrations started and finished are recorded in a journal (see journal).  If the
+    run stops before it finishes, eg because the deadline (a time.monotonic()) passed, the next run carries on from
+    the journal without reading the ledger and runs again the migrations that were running when it stopped.
+
+    :return: True if every migration was run
+    """
+    session = assumed_role.get_session(role_arn, "migrate")
+    read_ledger, record_in_ledger = ledger.get_ledger(
+        ledger_type,
+        session,
+        ssm_parameter_prefix,
+        ledger_file,
+        ledger_table,
+        ledger_endpoint_url,
+        max_workers,
+    )
+    organizations = ou_path_cache.add_ou_path_cache(
+        assumed_role.get_client(
+            session, "organizations", config=rate_limiter.get_client_config(max_workers)
+        ),
+        ou_path_cache.get_ou_ids_by_path(root_id, state_store.read_state(state_format)),
+    )
+    progress = bar.IncrementalBar(
+        "Migrating", max=len(os.listdir(f"environment/{root_id}/_migrations"))
+    )
+    previous_run = None
+    if journal_file is not None:
+        previous_run = journal.read_journal(journal_file, root_id)
+        write_to_journal = journal.get_writer(journal_file, root_id)
+    if previous_run is None:
+        applied_migration_ids = read_ledger()
+        if journal_file is not None:
+            write_to_journal(
+                journal.RUN, applied_migration_ids=sorted(applied_migration_ids)
+            )
+    else:
+        applied_migration_ids = journal.get_applied_migration_ids(previous_run)
+        click.echo(
+            f"Carrying on from {journal_file}: {len(previous_run.get('finished'))} migrations finished, "
+            f"{len(previous_run.get('started') - previous_run.get('finished'))} to run again"
+        )
+    migrations_to_run, migration_ids_already_run = get_migrations_to_run(
+        root_id, applied_migration_ids
+    )
+    for migration_id in migration_ids_already_run:
+        progress.next()
+        click.echo(f" Migration: {migration_id} already run")
+
+    snapshot = preconditions.make_snapshot() if check_preconditions else None
+
+    def start_migration(migration: dict) -> Tuple[bool, str]:
+        if journal_file is not None:
+            write_to_journal(
+                journal.STARTED, migration_id=migration.get("migration_id")
+            )
+        with metrics.phase(
+            metrics.MIGRATION,
+            per_thread=True,
+            root_id=root_id,
+            migration_id=migration.get("migration_id"),
+            migration_type=migration.get("migration_type"),
+        ) as event:
+            result, message = run_migration(root_id, organizations, migration, snapshot)
+            event["result"] = result
+            event["message"] = message
+        return result, message
+
+    def record_migration(migration: dict, result: bool, message: str) -> None:
+        progress.next()
+        migration_id = migration.get("migration_id")
+        status = "Ok" if result else "FAILED"
+        click.echo(f"{migration_id}: {status} - {message}")
+        record_in_ledger(
+            migration_id,
+            status if result else f"{status}: {message}",
+            f"Migration run: {datetime.utcnow()}",
+        )
+        if journal_file is not None:
+            write_to_journal(journal.FINISHED, migration_id=migration_id)
+
+    not_run = migration_executor.run_migrations(
+        migrations_to_run,
+        start_migration,
+        record_migration,
+        migration_executor.get_ou_paths_by_id(environment_index.build_index(root_id)),
+        max_workers,
+        deadline,
+    )
+    progress.finish()
+    if not_run > 0:
+        click.echo(
+            f"Stopped with {not_run} migrations not run as the time allowed ran out, run migrate again to carry on"
+        )
+        return False
+    if journal_file is not None:
+        journal.clear(journal_file, root_id)
+    return True
+
+
+def plan_migrations(
+    root_id: str,
+    role_arn: str,
+    ssm_parameter_prefix: str,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    ledger_type: str = ledger.DEFAULT_LEDGER,
+    ledger_file: str = ledger.DEFAULT_LEDGER_FILE,
+    ledger_table: str = ledger.DEFAULT_LEDGER_TABLE,
+    ledger_endpoint_url: str = None,
+    state_format: str = state_store.DEFAULT_STATE_FORMAT,
+    organizations_calls_per_second: float = migration_plan.DEFAULT_ORGANIZATIONS_CALLS_PER_SECOND,
+    ledger_calls_per_second: float = migration_plan.DEFAULT_LEDGER_CALLS_PER_SECOND,
+    check_preconditions: bool = True,
+    journal_file: str = journal.DEFAULT_JOURNAL_FILE,
+) -> None:
+    """
+    Shows what migrate would do without changing anything: the order the migrations not run yet would be run in, which
+    of them would run at the same time, the number of calls they would make and an estimate of how long they would
+    take.  Like migrate, the migrations already run are read from the journal of a run that did not finish (unless
+    journal_file is None) or else from the ledger.  The only calls made are to read the ledger, so the role is only
+    assumed when the ledger is read and is not a file.
+    """
+    previous_run = None
+    if journal_file is not None:
+        previous_run = journal.read_journal(journal_file, root_id)
+    if previous_run is None:
+        session = None
+        if ledger_type != ledger.LEDGER_FILE:
+            session = assumed_role.get_session(role_arn, "migrate")
+        read_ledger, _ = ledger.get_ledger(
+            ledger_type,
+            session,
+            ssm_parameter_prefix,
+            ledger_file,
+            ledger_table,
+            ledger_endpoint_url,
+            max_workers,
+        )
+        applied_migration_ids = read_ledger()
+    else:
+        applied_migration_ids = journal.get_applied_migration_ids(previous_run)
+    migrations_to_run, migration_ids_already_run = get_migrations_to_run(
+        root_id, applied_migration_ids
+    )
+    steps, calls = migration_plan.make_plan(
+        migrations_to_run,
+        migration_executor.get_ou_paths_by_id(environment_index.build_index(root_id)),
+        ou_path_cache.get_ou_ids_by_path(root_id, state_store.read_state(state_format)),
+        check_preconditions,
+    )
+    ledger_read_calls, ledger_record_calls = migration_plan.get_ledger_calls(
+        ledger_type, len(applied_migration_ids), len(migrations_to_run)
+    )
+    if previous_run is not None:
+        ledger_read_calls = 0
+    estimated_seconds = migration_plan.get_estimated_seconds(
+        steps,
+        calls,
+        ledger_record_calls,
+        max_workers,
+        organizations_calls_per_second,
+        ledger_calls_per_second,
+    )
+
+    if previous_run is not None:
+        click.echo(f"Carrying on from {journal_file}")
+    click.echo(
+        f"Plan for {root_id}: {len(migrations_to_run)} migrations to run, "
+        f"{len(migration_ids_already_run)} already run"
+    )
+    for step_number, step in enumerate(steps, start=1):
+        click.echo(
+            f"Step {step_number}: {len(step)} migration(s) that can run at the same time"
+        )
+        for i in step:
+            migration = migrations_to_run[i]
+            click.echo(
+                f"  {migration.get('migration_id')}: {migration.get('migration_type')} "
+                f"({calls[i]} Organizations call(s))"
+            )
+    click.echo(f"Organizations calls: {sum(calls)}")
+    click.echo(
+        f"Ledger ({ledger_type}) calls: {ledger_read_calls} to read, {ledger_record_calls} to record"
+    )
+    click.echo(
+        f"Estimated time: {estimated_seconds:.1f} seconds with {max_workers} workers at "
+        f"{organizations_calls_per_second} Organizations and {ledger_calls_per_second} ledger calls per second"
+    )
 
 
 def prune_metadata() -> None:
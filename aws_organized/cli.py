@@ -1,9 +1,19 @@
 # Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: Apache-2.0
 import os
+import time
 import click
 from aws_organized import helpers
+from aws_organized import api_profiler
 from aws_organized import aws_organized
+from aws_organized import environment_index
+from aws_organized import journal
+from aws_organized import ledger
+from aws_organized import metrics
+from aws_organized import migration_plan
+from aws_organized import migration_writer
+from aws_organized import rate_limiter
+from aws_organized import state_store
 from aws_organized.extensions.service_control_policies import service_control_policies
 from aws_organized.extensions.delegated_administrators import delegated_administrators
 from betterboto import client as betterboto_client
@@ -28,21 +38,78 @@ def apply_migration_policies(role_arn) -> None:
 
 
 @cli.command()
+@click.option("--max-workers", default=aws_organized.DEFAULT_MAX_WORKERS)
+@click.option(
+    "--enumeration-mode",
+    default=aws_organized.DEFAULT_ENUMERATION_MODE,
+    type=click.Choice(aws_organized.ENUMERATION_MODES),
+)
+@click.option("--incremental/--no-incremental", default=False)
+@click.option("--change-feed", default=None)
+@click.option(
+    "--state-format",
+    default=state_store.DEFAULT_STATE_FORMAT,
+    type=click.Choice(state_store.STATE_FORMATS),
+)
+@click.option("--metrics-out", default=None)
+@click.option("--profile-api", is_flag=True, default=False)
+@click.option("--profile-api-out", default=None)
 @click.argument("role_arn")
-def import_organization(role_arn):
-    with betterboto_client.CrossAccountClientContextManager(
-        "organizations", role_arn, f"organizations"
-    ) as organizations:
-        for root in organizations.list_roots_single_page().get("Roots", []):
-            os.makedirs(f"environment/{root.get('Id')}", exist_ok=True)
-    roots = os.listdir("environment")
-    for root_id in roots:
-        if root_id in ["migrations", "Policies", "policies_migration"]:
-            continue
-        click.echo(f"Processing root_id: {root_id}")
-        aws_organized.import_organization(role_arn, root_id)
-        service_control_policies.import_organization_policies(role_arn, root_id)
-        delegated_administrators.import_organization(role_arn, root_id)
+def import_organization(
+    max_workers: int,
+    enumeration_mode: str,
+    incremental: bool,
+    change_feed: str,
+    state_format: str,
+    metrics_out: str,
+    profile_api: bool,
+    profile_api_out: str,
+    role_arn: str,
+):
+    if change_feed is not None and not incremental:
+        raise click.UsageError("--change-feed needs --incremental")
+    if incremental and change_feed is None:
+        raise click.UsageError("--incremental needs --change-feed")
+    with metrics.recording(metrics_out), api_profiler.profiling(
+        profile_api, profile_api_out
+    ):
+        with betterboto_client.CrossAccountClientContextManager(
+            "organizations",
+            role_arn,
+            f"organizations",
+            config=rate_limiter.get_client_config(max_workers),
+        ) as organizations:
+            rate_limiter.add_rate_limiter(organizations)
+            metrics.add_call_counter(organizations)
+            api_profiler.add_profiler(organizations)
+            for root in organizations.list_roots_single_page().get("Roots", []):
+                os.makedirs(f"environment/{root.get('Id')}", exist_ok=True)
+        roots = os.listdir("environment")
+        for root_id in roots:
+            if root_id in ["migrations", "Policies", "policies_migration"]:
+                continue
+            click.echo(f"Processing root_id: {root_id}")
+            state = aws_organized.import_organization(
+                role_arn,
+                root_id,
+                max_workers,
+                enumeration_mode,
+                incremental,
+                change_feed,
+                state_format,
+            )
+            with metrics.phase(
+                metrics.SERVICE_CONTROL_POLICIES_IMPORT, root_id=root_id
+            ):
+                service_control_policies.import_organization_policies(
+                    role_arn, root_id, state_format, max_workers, state
+                )
+            with metrics.phase(
+                metrics.DELEGATED_ADMINISTRATORS_IMPORT, root_id=root_id
+            ):
+                delegated_administrators.import_organization(
+                    role_arn, root_id, state_format, state
+                )
 
 
 @cli.command()
@@ -81,15 +148,41 @@ def provision_import_organization_role_stack(
 
 
 @cli.command()
-@click.argument("role_arn")
-def make_migrations(role_arn):
-    for root_id in os.listdir("environment"):
-        if root_id in ["migrations", "Policies", "policies_migration"]:
-            continue
-        click.echo(f"Processing root_id: {root_id}")
-        aws_organized.make_migrations(role_arn, root_id)
-        service_control_policies.make_migrations(role_arn, root_id)
-        delegated_administrators.make_migrations(role_arn, root_id)
+@click.option("--max-workers", default=aws_organized.DEFAULT_MAX_WORKERS)
+@click.option("--from-snapshot", default=None)
+@click.option("--manifest/--no-manifest", default=False)
+@click.option("--metrics-out", default=None)
+@click.option("--profile-api", is_flag=True, default=False)
+@click.option("--profile-api-out", default=None)
+@click.argument("role_arn", required=False)
+def make_migrations(
+    max_workers: int,
+    from_snapshot: str,
+    manifest: bool,
+    metrics_out: str,
+    profile_api: bool,
+    profile_api_out: str,
+    role_arn: str,
+):
+    with metrics.recording(metrics_out), api_profiler.profiling(
+        profile_api, profile_api_out
+    ):
+        if from_snapshot is not None:
+            snapshot = aws_organized.read_snapshot(from_snapshot)
+        elif role_arn is not None:
+            with metrics.phase(metrics.REMOTE_SNAPSHOT):
+                snapshot = aws_organized.get_remote_snapshot(role_arn, max_workers)
+        else:
+            raise click.UsageError("Provide a ROLE_ARN or --from-snapshot")
+        for root_id in os.listdir("environment"):
+            if root_id in ["migrations", "Policies", "policies_migration"]:
+                continue
+            click.echo(f"Processing root_id: {root_id}")
+            index = environment_index.build_index(root_id)
+            with migration_writer.buffered(root_id, manifest):
+                aws_organized.make_migrations(root_id, snapshot, index)
+                service_control_policies.make_migrations(root_id, snapshot, index)
+                delegated_administrators.make_migrations(root_id, snapshot, index)
 
 
 @cli.command()
@@ -129,10 +222,98 @@ def provision_make_migrations_role_stack(
 
 @cli.command()
 @click.option("--ssm-parameter-prefix", default="/-AWS-Organized")
+@click.option("--max-workers", default=aws_organized.DEFAULT_MAX_WORKERS)
+@click.option(
+    "--ledger",
+    "ledger_type",
+    default=ledger.DEFAULT_LEDGER,
+    type=click.Choice(ledger.LEDGERS),
+)
+@click.option("--ledger-file", default=ledger.DEFAULT_LEDGER_FILE)
+@click.option("--ledger-table", default=ledger.DEFAULT_LEDGER_TABLE)
+@click.option("--ledger-endpoint-url", default=None)
+@click.option(
+    "--state-format",
+    default=state_store.DEFAULT_STATE_FORMAT,
+    type=click.Choice(state_store.STATE_FORMATS),
+)
+@click.option("--plan", is_flag=True, default=False)
+@click.option("--check-preconditions/--no-check-preconditions", default=True)
+@click.option("--journal/--no-journal", "use_journal", default=True)
+@click.option("--journal-file", default=journal.DEFAULT_JOURNAL_FILE)
+@click.option("--max-duration", default=None, type=int)
+@click.option(
+    "--organizations-calls-per-second",
+    default=migration_plan.DEFAULT_ORGANIZATIONS_CALLS_PER_SECOND,
+)
+@click.option(
+    "--ledger-calls-per-second",
+    default=migration_plan.DEFAULT_LEDGER_CALLS_PER_SECOND,
+)
+@click.option("--metrics-out", default=None)
+@click.option("--profile-api", is_flag=True, default=False)
+@click.option("--profile-api-out", default=None)
 @click.argument("role_arn")
-def migrate(ssm_parameter_prefix: str, role_arn: str):
-    for root_id in os.listdir("environment"):
-        aws_organized.migrate(root_id, role_arn, ssm_parameter_prefix)
+def migrate(
+    ssm_parameter_prefix: str,
+    max_workers: int,
+    ledger_type: str,
+    ledger_file: str,
+    ledger_table: str,
+    ledger_endpoint_url: str,
+    state_format: str,
+    plan: bool,
+    check_preconditions: bool,
+    use_journal: bool,
+    journal_file: str,
+    max_duration: int,
+    organizations_calls_per_second: float,
+    ledger_calls_per_second: float,
+    metrics_out: str,
+    profile_api: bool,
+    profile_api_out: str,
+    role_arn: str,
+):
+    with metrics.recording(metrics_out), api_profiler.profiling(
+        profile_api, profile_api_out
+    ):
+        deadline = None if max_duration is None else time.monotonic() + max_duration
+        for root_id in os.listdir("environment"):
+            if plan:
+                aws_organized.plan_migrations(
+                    root_id,
+                    role_arn,
+                    ssm_parameter_prefix,
+                    max_workers,
+                    ledger_type,
+                    ledger_file,
+                    ledger_table,
+                    ledger_endpoint_url,
+                    state_format,
+                    organizations_calls_per_second,
+                    ledger_calls_per_second,
+                    check_preconditions,
+                    journal_file if use_journal else None,
+                )
+            else:
+                finished = aws_organized.migrate(
+                    root_id,
+                    role_arn,
+                    ssm_parameter_prefix,
+                    max_workers,
+                    ledger_type,
+                    ledger_file,
+                    ledger_table,
+                    ledger_endpoint_url,
+                    state_format,
+                    check_preconditions,
+                    journal_file if use_journal else None,
+                    deadline,
+                )
+                if not finished:
+                    raise click.ClickException(
+                        "migrate stopped before running every migration"
+                    )
 
 
 @cli.command()
@@ -140,6 +321,7 @@ def migrate(ssm_parameter_prefix: str, role_arn: str):
 @click.option("--path", default="/AWSOrganized/")
 @click.option("--assuming-resource", default="root")
 @click.option("--ssm-parameter-prefix", default="/-AWS-Organized")
+@click.option("--ledger-table", default=ledger.DEFAULT_LEDGER_TABLE)
 @click.option("--output-format", default="yaml")
 @click.argument("assuming-account-id")
 def generate_migrate_role_template(
@@ -147,11 +329,17 @@ def generate_migrate_role_template(
     path: str,
     assuming_resource: str,
     ssm_parameter_prefix: str,
+    ledger_table: str,
     output_format: str,
     assuming_account_id: str,
 ):
     t = helpers.generate_migrate_role_template(
-        role_name, path, assuming_account_id, assuming_resource, ssm_parameter_prefix
+        role_name,
+        path,
+        assuming_account_id,
+        assuming_resource,
+        ssm_parameter_prefix,
+        ledger_table,
     )
     if output_format.lower() == "json":
         click.echo(t.to_json())
@@ -164,6 +352,7 @@ def generate_migrate_role_template(
 @click.option("--path", default="/AWSOrganized/")
 @click.option("--assuming-resource", default="root")
 @click.option("--ssm-parameter-prefix", default="/-AWS-Organized")
+@click.option("--ledger-table", default=ledger.DEFAULT_LEDGER_TABLE)
 @click.argument("assuming-account-id")
 def provision_migrate_role_stack(
     role_name: str,
@@ -171,9 +360,15 @@ def provision_migrate_role_stack(
     assuming_resource: str,
     assuming_account_id: str,
     ssm_parameter_prefix: str,
+    ledger_table: str,
 ):
     helpers.provision_migrate_role_stack(
-        role_name, path, assuming_account_id, assuming_resource, ssm_parameter_prefix
+        role_name,
+        path,
+        assuming_account_id,
+        assuming_resource,
+        ssm_parameter_prefix,
+        ledger_table,
     )
 
 
@@ -274,6 +469,7 @@ def provision_codepipeline_stack(
         migrate_role_arn,
     )
 
+
 @cli.command()
 def prune_metadata():
     for root_id in os.listdir("environment"):
@@ -284,5 +480,6 @@ def prune_metadata():
         service_control_policies.prune_metadata(root_id)
         delegated_administrators.prune_metadata(root_id)
 
+
 if __name__ == "__main__":
     cli()
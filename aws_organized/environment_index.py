@@ -0,0 +1,132 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+import os
+
+import yaml
+
+SEP = os.path.sep
+ENVIRONMENT_DIR = "environment"
+META_FILE_NAME = "_meta.yaml"
+SERVICE_CONTROL_POLICIES_FILE_NAME = "_service_control_policies.yaml"
+DELEGATED_ADMINISTRATORS_FILE_NAME = "_delegated_administrators.yaml"
+POLICY_CONTENT_FILE_NAME = "policy.json"
+
+ROOT = "ROOT"
+ORGANIZATIONAL_UNIT = "ORGANIZATIONAL_UNIT"
+ACCOUNT = "ACCOUNT"
+SERVICE_CONTROL_POLICY = "SERVICE_CONTROL_POLICY"
+ENTITY_TYPES = [ROOT, ORGANIZATIONAL_UNIT, ACCOUNT, SERVICE_CONTROL_POLICY]
+
+# folders that never contain OUs, accounts or policies
+SKIPPED_FOLDERS = ["_migrations"]
+
+
+def get_entity_type(root_path: str, folder: str) -> str:
+    if folder == root_path:
+        return ROOT
+    parts = folder.split(SEP)
+    if parts[-2] == "_organizational_units":
+        return ORGANIZATIONAL_UNIT
+    elif parts[-2] == "_accounts":
+        return ACCOUNT
+    elif parts[-2] == "service_control_policies" and parts[-3] == "_policies":
+        return SERVICE_CONTROL_POLICY
+    return None
+
+
+def read_yaml_if_present(folder: str, file_name: str, file_names: list):
+    if file_name not in file_names:
+        return None
+    with open(SEP.join([folder, file_name]), "r") as f:
+        return yaml.safe_load(f.read())
+
+
+def read_text_if_present(folder: str, file_name: str, file_names: list) -> str:
+    if file_name not in file_names:
+        return None
+    with open(SEP.join([folder, file_name]), "r") as f:
+        return f.read()
+
+
+def build_index(root_id: str) -> dict:
+    """
+    Walks environment/<root_id> once and reads every _meta.yaml, _service_control_policies.yaml,
+    _delegated_administrators.yaml and policy.json in it.  Each root, OU, account and policy folder becomes an entity:
+
+        dict(
+            type=one of ENTITY_TYPES,
+            path=the folder,
+            name=the name of the folder,
+            parent_path=the folder of the parent root or OU (OUs and accounts only),
+            meta=the contents of _meta.yaml or None,
+            service_control_policies=the contents of _service_control_policies.yaml or None,
+            delegated_administrators=the contents of _delegated_administrators.yaml or None,
+            policy_content=the text of policy.json or None,
+        )
+
+    :param root_id:
+    :return: dict with by_path: {path: entity} and for each entity type: {by_path, by_id, by_name: {name: [entity]}}
+    """
+    root_path = SEP.join([ENVIRONMENT_DIR, root_id])
+    index = dict(root_id=root_id, by_path=dict())
+    for entity_type in ENTITY_TYPES:
+        index[entity_type] = dict(by_path=dict(), by_id=dict(), by_name=dict())
+
+    for folder, folder_names, file_names in os.walk(root_path):
+        folder_names[:] = [f for f in folder_names if f not in SKIPPED_FOLDERS]
+        entity_type = get_entity_type(root_path, folder)
+        if entity_type is None:
+            continue
+        entity = dict(
+            type=entity_type,
+            path=folder,
+            name=folder.split(SEP)[-1],
+            parent_path=None,
+            meta=read_yaml_if_present(folder, META_FILE_NAME, file_names),
+            service_control_policies=read_yaml_if_present(
+                folder, SERVICE_CONTROL_POLICIES_FILE_NAME, file_names
+            ),
+            delegated_administrators=read_yaml_if_present(
+                folder, DELEGATED_ADMINISTRATORS_FILE_NAME, file_names
+            ),
+            policy_content=read_text_if_present(
+                folder, POLICY_CONTENT_FILE_NAME, file_names
+            ),
+        )
+        if entity_type in [ORGANIZATIONAL_UNIT, ACCOUNT]:
+            entity["parent_path"] = SEP.join(folder.split(SEP)[0:-2])
+        add_entity(index, entity)
+    return index
+
+
+def add_entity(index: dict, entity: dict) -> None:
+    index["by_path"][entity.get("path")] = entity
+    by_type = index[entity.get("type")]
+    by_type["by_path"][entity.get("path")] = entity
+    by_type["by_name"].setdefault(entity.get("name"), list()).append(entity)
+    if entity.get("meta") is not None and entity.get("meta").get("Id") is not None:
+        by_type["by_id"][entity.get("meta").get("Id")] = entity
+
+
+def get_entities(index: dict, entity_type: str) -> list:
+    return list(index[entity_type]["by_path"].values())
+
+
+def get_entity_by_path(index: dict, path: str) -> dict:
+    return index["by_path"].get(path)
+
+
+def get_entity_by_id(index: dict, entity_type: str, id: str) -> dict:
+    return index[entity_type]["by_id"].get(id)
+
+
+def get_parent(index: dict, entity: dict) -> dict:
+    if entity.get("parent_path") is None:
+        return None
+    return get_entity_by_path(index, entity.get("parent_path"))
+
+
+def get_id(entity: dict) -> str:
+    if entity is None or entity.get("meta") is None:
+        return None
+    return entity.get("meta").get("Id")
@@ -2,12 +2,18 @@
 # SPDX-License-Identifier: Apache-2.0
 import glob
 import collections
-from datetime import datetime
 import json
 import yaml
 import click
 import os
+from concurrent import futures
 from betterboto import client as betterboto_client
+from aws_organized import api_profiler
+from aws_organized import environment_index
+from aws_organized import migration_writer
+from aws_organized import metrics
+from aws_organized import rate_limiter
+from aws_organized import state_store
 from . import migrations
 from progress import bar
 
@@ -161,63 +167,85 @@ def remove_any_existing_records(root_id: str) -> None:
         os.remove(policy)
 
 
-def import_organization(role_arn, root_id) -> None:
-    remove_any_existing_records(root_id)
-    with betterboto_client.CrossAccountClientContextManager(
-        "organizations", role_arn, f"organizations"
-    ) as organizations:
-        delegated_administrators = (
-            organizations.list_delegated_administrators_single_page().get(
-                "DelegatedAdministrators", []
-            )
+def get_delegated_services_from_state(state: dict) -> list:
+    """
+    Returns the account Id and delegated services of each delegated administrator saved in the state, or None if the
+    state was written before delegated administrators were saved in it
+    """
+    if state is None or state.get("delegated_administrators") is None:
+        return None
+    return list(state.get("delegated_administrators").items())
+
+
+def get_delegated_services_from_org(organizations) -> list:
+    delegated_administrators = (
+        organizations.list_delegated_administrators_single_page().get(
+            "DelegatedAdministrators", []
         )
-        progress = bar.IncrementalBar(
-            "Importing Delegated Administrators", max=len(delegated_administrators)
+    )
+    return [
+        (
+            delegated_administrator.get("Id"),
+            organizations.list_delegated_services_for_account_single_page(
+                AccountId=delegated_administrator.get("Id")
+            ).get("DelegatedServices"),
         )
-        for delegated_administrator in delegated_administrators:
-            progress.next()
-            account_id = delegated_administrator.get("Id")
-            account_name = delegated_administrator.get("Name")
-            delegated_services = (
-                organizations.list_delegated_services_for_account_single_page(
-                    AccountId=account_id
-                ).get("DelegatedServices")
-            )
+        for delegated_administrator in delegated_administrators
+    ]
 
-            account_file = glob.glob(
-                f"environment/{root_id}/**/{account_name}/_meta.yaml",
-                recursive=True,
-            )
-            assert (
-                len(account_file) == 1
-            ), "found more or less than 1 account_meta file when searching by name"
-            delegated_administrators_file = account_file[0].replace(
-                "_meta", "_delegated_administrators"
-            )
-            open(delegated_administrators_file, "w").write(
-                yaml.safe_dump(delegated_services)
-            )
+
+def import_organization(
+    role_arn,
+    root_id,
+    state_format: str = state_store.DEFAULT_STATE_FORMAT,
+    state: dict = None,
+) -> None:
+    """
+    Writes the _delegated_administrators.yaml of each delegated administrator, found in the environment by its account
+    Id.  The state is read from the state file unless the state just written by import-organization is passed in.
+    """
+    remove_any_existing_records(root_id)
+    if state is None:
+        state = state_store.read_state(state_format)
+    delegated_administrators = get_delegated_services_from_state(state)
+    if delegated_administrators is None:
+        with betterboto_client.CrossAccountClientContextManager(
+            "organizations",
+            role_arn,
+            f"organizations",
+            config=rate_limiter.get_client_config(1),
+        ) as organizations:
+            rate_limiter.add_rate_limiter(organizations)
+            metrics.add_call_counter(organizations)
+            api_profiler.add_profiler(organizations)
+            delegated_administrators = get_delegated_services_from_org(organizations)
+    index = environment_index.build_index(root_id)
+    progress = bar.IncrementalBar(
+        "Importing Delegated Administrators", max=len(delegated_administrators)
+    )
+    for account_id, delegated_services in delegated_administrators:
+        progress.next()
+        account = environment_index.get_entity_by_id(
+            index, environment_index.ACCOUNT, account_id
+        )
+        if account is None:
+            click.echo(f"Skipping delegated administrator {account_id}: not found")
+            continue
+        delegated_administrators_file = SEP.join(
+            [account.get("path"), environment_index.DELEGATED_ADMINISTRATORS_FILE_NAME]
+        )
+        open(delegated_administrators_file, "w").write(
+            yaml.safe_dump(delegated_services)
+        )
+    progress.finish()
 
 
 def write_migration(
     extension: str, root_id: str, migration_type: str, migration_params: dict
 ) -> None:
-    now = datetime.now()
-    timestamp = datetime.timestamp(now)
-    migration_file_name = f"{timestamp}_{migration_type}.yaml"
-    os.makedirs(SEP.join(["environment", root_id, "_migrations"]), exist_ok=True)
-    with open(
-        SEP.join(["environment", root_id, "_migrations", migration_file_name]), "w"
-    ) as f:
-        f.write(
-            yaml.safe_dump(
-                dict(
-                    extension=extension,
-                    migration_type=migration_type,
-                    migration_params=migration_params,
-                )
-            )
-        )
+    migration_writer.write_migration(
+        extension, root_id, migration_type, migration_params
+    )
 
 
 def check_attachment(root_id: str, policy_file_path: str, organizations) -> None:
@@ -245,23 +273,43 @@ def check_attachment(root_id: str, policy_file_path: str, organizations) -> None
             )
 
 
-def check_existing(root_id: str, organizations) -> None:
-    administrators = glob.glob(
-        f"environment/{root_id}/**/_delegated_administrators.yaml", recursive=True
-    )
-    for administrator in administrators:
-        local_delegated = yaml.safe_load(open(administrator, "r").read())
-        account_details = yaml.safe_load(
-            open(
-                administrator.replace("_delegated_administrators", "_meta"), "r"
-            ).read()
+def get_delegated_services(organizations, max_workers: int) -> dict:
+    """
+    Lists the services delegated to each delegated administrator using a pool of max_workers threads
+
+    :param organizations:
+    :param max_workers:
+    :return: dict of account Id to the DelegatedServices of the account
+    """
+    response = organizations.list_delegated_administrators_single_page()
+    account_ids = [
+        delegated_administrator.get("Id")
+        for delegated_administrator in response.get("DelegatedAdministrators", [])
+    ]
+
+    def get_services(account_id: str) -> list:
+        return organizations.list_delegated_services_for_account_single_page(
+            AccountId=account_id
+        ).get("DelegatedServices", [])
+
+    with futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return dict(zip(account_ids, executor.map(get_services, account_ids)))
+
+
+def check_existing(root_id: str, snapshot: dict, index: dict = None) -> None:
+    if index is None:
+        index = environment_index.build_index(root_id)
+    for account in environment_index.get_entities(index, environment_index.ACCOUNT):
+        local_delegated = account.get("delegated_administrators")
+        if local_delegated is None:
+            continue
+        account_details = account.get("meta")
+        remote_delegated = snapshot.get("delegated_administrators").get(
+            account_details.get("Id")
         )
-        try:
-            response = organizations.list_delegated_services_for_account_single_page(
-                AccountId=account_details.get("Id")
-            )
+        if remote_delegated is not None:
             remote_delegated_as_dict = dict()
-            for delegated_service in response.get("DelegatedServices", []):
+            for delegated_service in remote_delegated:
                 remote_delegated_as_dict[
                     delegated_service.get(ServicePrincipal)
                 ] = delegated_service
@@ -288,7 +336,7 @@ def check_existing(root_id: str, organizations) -> None:
                             ),
                         ),
                     )
-            for delegated_service in response.get("DelegatedServices", []):
+            for delegated_service in remote_delegated:
                 if (
                     local_delegated_as_dict.get(delegated_service.get(ServicePrincipal))
                     is None
@@ -303,7 +351,7 @@ def check_existing(root_id: str, organizations) -> None:
                         ),
                     )
 
-        except organizations.exceptions.AccountNotRegisteredException:
+        else:
             for administrator_detail in local_delegated:
                 write_migration(
                     EXTENSION,
@@ -316,11 +364,13 @@ def check_existing(root_id: str, organizations) -> None:
                 )
 
 
-def make_migrations(role_arn: str, root_id: str) -> None:
-    with betterboto_client.CrossAccountClientContextManager(
-        "organizations", role_arn, f"organizations"
-    ) as organizations:
-        check_existing(root_id, organizations)
+def make_migrations(root_id: str, snapshot: dict, index: dict = None) -> None:
+    if index is None:
+        index = environment_index.build_index(root_id)
+    with metrics.phase(
+        metrics.MAKE_MIGRATIONS_CHECK, root_id=root_id, check="check_existing"
+    ):
+        check_existing(root_id, snapshot, index)
 
 
 
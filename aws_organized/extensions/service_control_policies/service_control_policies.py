@@ -1,12 +1,19 @@
 # Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: Apache-2.0
 import glob
-from datetime import datetime
+import hashlib
+from concurrent import futures
 import json
 import yaml
 import click
 import os
 from betterboto import client as betterboto_client
+from aws_organized import api_profiler
+from aws_organized import environment_index
+from aws_organized import migration_writer
+from aws_organized import metrics
+from aws_organized import rate_limiter
+from aws_organized import state_store
 from . import migrations
 from progress import bar
 
@@ -15,26 +22,116 @@ ORGANIZATIONAL_UNIT = "ORGANIZATIONAL_UNIT"
 ACCOUNT = "ACCOUNT"
 SEP = os.path.sep
 EXTENSION = "service_control_policies"
+POLICIES_CACHE_FILE = "service_control_policies_cache.json"
+
+
+def get_content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def read_policies_cache() -> dict:
+    if not os.path.exists(POLICIES_CACHE_FILE):
+        return dict()
+    with open(POLICIES_CACHE_FILE, "r") as f:
+        return json.loads(f.read())
+
+
+def is_cached(cached_files: dict, file_path: str, content_hash: str) -> bool:
+    """
+    A file is cached when the last import wrote the same content to it and its size and modification time show it
+    has not been touched since
+    """
+    cached_file = cached_files.get(file_path)
+    if cached_file is None or cached_file.get("hash") != content_hash:
+        return False
+    try:
+        stat = os.stat(file_path)
+    except FileNotFoundError:
+        return False
+    return (
+        cached_file.get("size") == stat.st_size
+        and cached_file.get("mtime_ns") == stat.st_mtime_ns
+    )
 
 
-def save_all_policies_from_org(root_id: str, organizations) -> None:
-    all_service_control_policies_in_org = organizations.list_policies_single_page(
-        Filter=SERVICE_CONTROL_POLICY
-    ).get("Policies")
-    for policy in all_service_control_policies_in_org:
+def write_file_unless_cached(
+    cached_files: dict, files: dict, file_path: str, content: str
+) -> None:
+    content_hash = get_content_hash(content)
+    if not is_cached(cached_files, file_path, content_hash):
+        open(file_path, "w").write(content)
+    stat = os.stat(file_path)
+    files[file_path] = dict(
+        hash=content_hash, size=stat.st_size, mtime_ns=stat.st_mtime_ns
+    )
+
+
+def save_policy_from_org(
+    root_id: str, policy: dict, organizations, cached_files: dict, content: str = None
+) -> dict:
+    if content is None:
         described_policy = organizations.describe_policy(PolicyId=policy.get("Id")).get(
             "Policy"
         )
-        policy_name = described_policy.get("PolicySummary").get("Name")
-        path = f"environment/{root_id}/_policies/service_control_policies/{policy_name}"
-        os.makedirs(path, exist_ok=True)
-        open(f"{path}/policy.json", "w").write(
-            json.dumps(json.loads(described_policy.get("Content")), indent=4)
-        )
-        del described_policy["Content"]
-        open(f"{path}/_meta.yaml", "w").write(
-            yaml.safe_dump(described_policy.get("PolicySummary"))
-        )
+    else:
+        described_policy = dict(PolicySummary=dict(policy), Content=content)
+    policy_name = described_policy.get("PolicySummary").get("Name")
+    path = f"environment/{root_id}/_policies/service_control_policies/{policy_name}"
+    os.makedirs(path, exist_ok=True)
+    files = dict()
+    write_file_unless_cached(
+        cached_files,
+        files,
+        f"{path}/policy.json",
+        json.dumps(json.loads(described_policy.get("Content")), indent=4),
+    )
+    del described_policy["Content"]
+    write_file_unless_cached(
+        cached_files,
+        files,
+        f"{path}/_meta.yaml",
+        yaml.safe_dump(described_policy.get("PolicySummary")),
+    )
+    return files
+
+
+def save_all_policies_from_org(
+    root_id: str, organizations, max_workers: int = 1, state: dict = None
+) -> None:
+    """
+    Describes every SCP using a pool of max_workers threads and writes its policy.json and _meta.yaml.  The hash, size
+    and modification time of each file written are kept in POLICIES_CACHE_FILE, keyed by policy Id, so files whose
+    content has not changed since the last import are not written again.  When the state holds the policies and their
+    contents they are not listed or described again.
+    """
+    contents = dict()
+    if state is not None and state.get("service_control_policy_contents") is not None:
+        contents = state.get("service_control_policy_contents")
+        all_service_control_policies_in_org = [
+            policy.get("details")
+            for policy in state.get("service_control_policies").values()
+        ]
+    else:
+        all_service_control_policies_in_org = organizations.list_policies_single_page(
+            Filter=SERVICE_CONTROL_POLICY
+        ).get("Policies")
+    cache = read_policies_cache()
+    with futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        saves = {
+            policy.get("Id"): executor.submit(
+                save_policy_from_org,
+                root_id,
+                policy,
+                organizations,
+                cache.get(policy.get("Id"), dict()),
+                contents.get(policy.get("Id")),
+            )
+            for policy in all_service_control_policies_in_org
+        }
+        new_cache = {policy_id: save.result() for policy_id, save in saves.items()}
+    state_store.write_file_atomically(
+        POLICIES_CACHE_FILE, json.dumps(new_cache, indent=4).encode("utf-8")
+    )
 
 
 def get_id_for_entity_from_path(entity_path: str) -> str:
@@ -76,84 +173,129 @@ def get_path_for_ou(root_id: str, ou: dict) -> str:
     return SEP.join(file_path)
 
 
-def save_targets_for_policy(root_id, organizations) -> None:
+def get_paths_by_id(index: dict) -> dict:
+    """
+    Maps the Id in the _meta.yaml of the root, every OU and every account in the environment to its folder
+    """
+    paths_by_id = dict()
+    for entity_type in [
+        environment_index.ROOT,
+        environment_index.ORGANIZATIONAL_UNIT,
+        environment_index.ACCOUNT,
+    ]:
+        for id, entity in index[entity_type]["by_id"].items():
+            paths_by_id[id] = entity.get("path")
+    return paths_by_id
+
+
+def get_targets_for_policy(state: dict, policy_id: str, organizations) -> list:
+    """
+    Returns the targets of the policy from the attachment index update_state saved in the state file, falling back
+    to ListTargetsForPolicy for policies that are not in the index.
+    """
+    indexed_policy = state.get("service_control_policies", {}).get(policy_id)
+    if indexed_policy is not None:
+        return indexed_policy.get("targets", [])
+    return organizations.list_targets_for_policy_single_page(PolicyId=policy_id).get(
+        "Targets", []
+    )
+
+
+def get_output_for_entity(outputs: dict, meta_file_path: str) -> dict:
+    output_path = meta_file_path.replace("_meta.yaml", "_service_control_policies.yaml")
+    if outputs.get(output_path) is None:
+        outputs[output_path] = dict(Attached=list(), Inherited=list())
+    return outputs[output_path]
+
+
+def propagate_inherited_policies(
+    state: dict, paths_by_id: dict, attached_by_id: dict, outputs: dict
+) -> None:
+    """
+    Walks the OU tree in the state once, from each root down, passing the policies attached to each root and OU on
+    to every OU and account below it as Inherited entries.
+
+    :param state: the state written by import-organization
+    :param paths_by_id: the folder of each root, OU and account found in the environment
+    :param attached_by_id: the Inherited entries (policy plus Source) to pass down from each root or OU
+    :param outputs: the _service_control_policies.yaml contents by file path, updated in place
+    """
+    accounts_by_parent_id = dict()
+    for account_id, account in state.get("accounts").items():
+        parent_id = account.get("parents")[0].get("Id")
+        accounts_by_parent_id.setdefault(parent_id, list()).append(account_id)
+
+    def add_inherited(id: str, inherited: list) -> None:
+        if not inherited or paths_by_id.get(id) is None:
+            return
+        meta_file_path = SEP.join([paths_by_id.get(id), "_meta.yaml"])
+        output = get_output_for_entity(outputs, meta_file_path)
+        output["Inherited"] += inherited
+
+    nodes = [
+        (node, list())
+        for node in state.get("organizational_units").get("tree").values()
+    ]
+    while nodes:
+        node, inherited = nodes.pop()
+        id = node.get("details").get("Id")
+        add_inherited(id, inherited)
+        passed_down = inherited + attached_by_id.get(id, list())
+        for account_id in accounts_by_parent_id.get(id, list()):
+            add_inherited(account_id, passed_down)
+        for child in node.get("organizational_units").values():
+            nodes.append((child, passed_down))
+
+
+def write_outputs(outputs: dict, max_workers: int) -> None:
+    """
+    Writes each _service_control_policies.yaml once, atomically, using a pool of max_workers threads
+    """
+    with futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        writes = [
+            executor.submit(
+                state_store.write_file_atomically,
+                output_path,
+                yaml.safe_dump(output).encode("utf-8"),
+            )
+            for output_path, output in outputs.items()
+        ]
+        for write in futures.as_completed(writes):
+            write.result()
+
+
+def save_targets_for_policy(
+    root_id, organizations, state: dict, max_workers: int = 1
+) -> None:
     policies = glob.glob(
         f"environment/{root_id}/_policies/service_control_policies/*/*.yaml"
     )
-    state = yaml.safe_load(open("state.yaml", "r").read())
+    paths_by_id = get_paths_by_id(environment_index.build_index(root_id))
+    outputs = dict()
+    attached_by_id = dict()
     progress = bar.IncrementalBar("Importing policies", max=len(policies))
     for policy_file in policies:
         progress.next()
         policy = yaml.safe_load(open(policy_file, "r").read())
         policy_id = policy.get("Id")
-        targets = organizations.list_targets_for_policy_single_page(
-            PolicyId=policy_id
-        ).get("Targets", [])
+        targets = get_targets_for_policy(state, policy_id, organizations)
         for target in targets:
-            inherited = list()
-            if target.get("Type") == ACCOUNT:
-                account = (
-                    state.get("accounts").get(target.get("TargetId")).get("details")
-                )
-                attached = glob.glob(
-                    f"environment/{root_id}/**/{account.get('Name')}/_meta.yaml",
-                    recursive=True,
-                )
-            elif target.get("Type") == ORGANIZATIONAL_UNIT:
-                ou = (
-                    state.get("organizational_units")
-                    .get("by_id")
-                    .get(target.get("TargetId"))
-                )
-                path_to_ou = get_path_for_ou(root_id, ou)
-                attached = glob.glob(f"{path_to_ou}/_meta.yaml")
-                inherited += glob.glob(
-                    f"{path_to_ou}/_accounts/**/_meta.yaml", recursive=True
-                )
-                inherited += glob.glob(
-                    f"{path_to_ou}/_organizational_units/**/_meta.yaml", recursive=True
-                )
-            elif target.get("Type") == "ROOT":
-                attached = glob.glob(
-                    f"environment/{root_id}/_meta.yaml", recursive=True
-                )
-                inherited += glob.glob(
-                    f"environment/{root_id}/_meta.yaml", recursive=True
-                )
-            else:
+            if target.get("Type") not in [ACCOUNT, ORGANIZATIONAL_UNIT, "ROOT"]:
                 raise Exception(f"Not handled type: {target.get('Type')}")
-
-            really_attached = list()
-            for attach in attached:
-                a = yaml.safe_load(open(attach, 'r').read())
-                if a.get("Id") == target.get("TargetId"):
-                    really_attached.append(attach)
-
-            if really_attached:
-                assert (
-                    len(really_attached) == 1
-                ), f"mapping to attached entity found {len(really_attached)} entities for {target}"
-                really_attached = really_attached[0]
-                output_path = really_attached.replace(
-                    "_meta.yaml", "_service_control_policies.yaml"
+            target_path = paths_by_id.get(target.get("TargetId"))
+            if target_path is None:
+                click.echo(
+                    f"Skipping {target.get('TargetId')} for {policy_id}: no _meta.yaml found, run import-organization again"
                 )
-                output = dict(Attached=list(), Inherited=list())
-                if os.path.exists(output_path):
-                    output = yaml.safe_load(open(output_path, "r").read())
-                output["Attached"].append(policy)
-                open(output_path, "w").write(yaml.safe_dump(output))
-                for thing in inherited:
-                    output_path = thing.replace(
-                        "_meta.yaml", "_service_control_policies.yaml"
-                    )
-                    output = dict(Attached=list(), Inherited=list())
-                    if os.path.exists(output_path):
-                        output = yaml.safe_load(open(output_path, "r").read())
-                    i = dict(Source=target.get("Name"))
-                    i.update(policy)
-                    output["Inherited"].append(i)
-                    open(output_path, "w").write(yaml.safe_dump(output))
+                continue
+            meta_file_path = SEP.join([target_path, "_meta.yaml"])
+            get_output_for_entity(outputs, meta_file_path)["Attached"].append(policy)
+            i = dict(Source=target.get("Name"))
+            i.update(policy)
+            attached_by_id.setdefault(target.get("TargetId"), list()).append(i)
     progress.finish()
+    propagate_inherited_policies(state, paths_by_id, attached_by_id, outputs)
+    write_outputs(outputs, max_workers)
 
 
 def remove_any_existing_policy_records(root_id: str) -> None:
@@ -164,35 +306,83 @@ def remove_any_existing_policy_records(root_id: str) -> None:
         os.remove(policy)
 
 
-def import_organization_policies(role_arn, root_id) -> None:
+def import_organization_policies(
+    role_arn,
+    root_id,
+    state_format: str = state_store.DEFAULT_STATE_FORMAT,
+    max_workers: int = 1,
+    state: dict = None,
+) -> None:
+    """
+    Writes the SCPs of the organization and the _service_control_policies.yaml of each root, OU and account.  The state
+    is read from the state file unless the state just written by import-organization is passed in.
+    """
     with betterboto_client.CrossAccountClientContextManager(
-        "organizations", role_arn, f"organizations"
+        "organizations",
+        role_arn,
+        f"organizations",
+        config=rate_limiter.get_client_config(max_workers),
     ) as organizations:
+        rate_limiter.add_rate_limiter(organizations)
+        metrics.add_call_counter(organizations)
+        api_profiler.add_profiler(organizations)
+        if state is None:
+            state = state_store.read_state(state_format)
         progress = bar.IncrementalBar("Importing SCPs", max=4)
         progress.next()
         remove_any_existing_policy_records(root_id)
         progress.next()
-        save_all_policies_from_org(root_id, organizations)
+        save_all_policies_from_org(root_id, organizations, max_workers, state)
         progress.next()
-        save_targets_for_policy(root_id, organizations)
+        save_targets_for_policy(root_id, organizations, state, max_workers)
         progress.next()
         progress.finish()
 
 
-def check_policies(root_id: str, organizations) -> None:
-    scps_path = (
-        f"environment/{root_id}/_policies/service_control_policies/*/policy.json"
-    )
-    for policy_content_path in glob.glob(scps_path):
-        policy_file_path = policy_content_path.replace("policy.json", "_meta.yaml")
-        if os.path.exists(policy_file_path):
-            local_policy = yaml.safe_load(open(policy_file_path, "r").read())
+def get_policy_contents(organizations, by_policy_id: dict, max_workers: int) -> dict:
+    """
+    Describes the SCPs in by_policy_id using a pool of max_workers threads
+
+    :param organizations:
+    :param by_policy_id: the service_control_policies of the state
+    :param max_workers:
+    :return: dict of policy Id to the Content of the policy
+    """
+    policy_ids = list(by_policy_id.keys())
+
+    def get_content(policy_id: str) -> str:
+        return (
+            organizations.describe_policy(PolicyId=policy_id)
+            .get("Policy")
+            .get("Content")
+        )
+
+    with futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return dict(zip(policy_ids, executor.map(get_content, policy_ids)))
+
+
+def get_remote_policy(snapshot: dict, policy_id: str) -> dict:
+    remote_policy = snapshot.get("service_control_policies").get(policy_id)
+    if remote_policy is None:
+        raise Exception(f"{policy_id} was not found in the organization")
+    return remote_policy
+
+
+def check_policies(root_id: str, snapshot: dict, index: dict = None) -> None:
+    if index is None:
+        index = environment_index.build_index(root_id)
+    for policy in environment_index.get_entities(
+        index, environment_index.SERVICE_CONTROL_POLICY
+    ):
+        if policy.get("policy_content") is None:
+            continue
+        if policy.get("meta") is not None:
+            local_policy = policy.get("meta")
             if local_policy.get("AwsManaged"):
                 continue
-            p = organizations.describe_policy(PolicyId=local_policy.get("Id")).get(
-                "Policy"
+            remote_policy = get_remote_policy(snapshot, local_policy.get("Id")).get(
+                "details"
             )
-            remote_policy = p.get("PolicySummary")
             if local_policy.get("Name") != remote_policy.get(
                 "Name"
             ) or local_policy.get("Description") != remote_policy.get("Description"):
@@ -206,10 +396,11 @@ def check_policies(root_id: str, organizations) -> None:
                         description=local_policy.get("Description"),
                     ),
                 )
-            local_policy_content = json.dumps(
-                json.loads(open(policy_content_path, "r").read())
-            )
-            if local_policy_content != p.get("Content"):
+            local_policy_content = json.dumps(json.loads(policy.get("policy_content")))
+            remote_policy_contents = snapshot.get("service_control_policy_contents")
+            if local_policy_content != remote_policy_contents.get(
+                local_policy.get("Id")
+            ):
                 write_migration(
                     EXTENSION,
                     root_id,
@@ -217,51 +408,43 @@ def check_policies(root_id: str, organizations) -> None:
                     dict(id=local_policy.get("Id"), content=local_policy_content),
                 )
         else:
-            local_policy_content = json.dumps(
-                json.loads(open(policy_content_path, "r").read())
-            )
+            local_policy_content = json.dumps(json.loads(policy.get("policy_content")))
             write_migration(
                 EXTENSION,
                 root_id,
                 migrations.POLICY_CREATE,
-                dict(
-                    name=policy_file_path.split(SEP)[-2], content=local_policy_content
-                ),
+                dict(name=policy.get("name"), content=local_policy_content),
             )
 
 
 def write_migration(
     extension: str, root_id: str, migration_type: str, migration_params: dict
 ) -> None:
-    now = datetime.now()
-    timestamp = datetime.timestamp(now)
-    migration_file_name = f"{timestamp}_{migration_type}.yaml"
-    os.makedirs(SEP.join(["environment", root_id, "_migrations"]), exist_ok=True)
-    with open(
-        SEP.join(["environment", root_id, "_migrations", migration_file_name]), "w"
-    ) as f:
-        f.write(
-            yaml.safe_dump(
-                dict(
-                    extension=extension,
-                    migration_type=migration_type,
-                    migration_params=migration_params,
-                )
-            )
-        )
+    migration_writer.write_migration(
+        extension, root_id, migration_type, migration_params
+    )
 
 
-def check_attachment(root_id: str, policy_file_path: str, organizations) -> None:
-    local_policies = yaml.safe_load(open(policy_file_path, "r").read())
-    meta = yaml.safe_load(
-        open(
-            policy_file_path.replace("_service_control_policies.yaml", "_meta.yaml"),
-            "r",
-        ).read()
-    )
-    remote_policies = organizations.list_policies_for_target_single_page(
-        TargetId=meta.get("Id"), Filter=SERVICE_CONTROL_POLICY
-    ).get("Policies")
+def get_remote_policies_by_target_id(snapshot: dict) -> dict:
+    remote_policies_by_target_id = dict()
+    for policy in snapshot.get("service_control_policies").values():
+        for target in policy.get("targets"):
+            remote_policies_by_target_id.setdefault(
+                target.get("TargetId"), list()
+            ).append(policy.get("details"))
+    return remote_policies_by_target_id
+
+
+def check_attachment(
+    root_id: str, entity: dict, remote_policies_by_target_id: dict
+) -> None:
+    local_policies = entity.get("service_control_policies")
+    meta = entity.get("meta")
+    if meta is None:
+        raise Exception(f"{entity.get('path')} has no _meta.yaml")
+    if not local_policies.get("Attached"):
+        return
+    remote_policies = remote_policies_by_target_id.get(meta.get("Id"), list())
     for local_policy in local_policies.get("Attached", []):
         found = False
         for remote_policy in remote_policies:
@@ -276,20 +459,26 @@ def check_attachment(root_id: str, policy_file_path: str, organizations) -> None
             )
 
 
-def check_attachments(root_id: str, organizations) -> None:
-    policies = glob.glob(
-        f"environment/{root_id}/**/_service_control_policies.yaml", recursive=True
-    )
-    for policy_file_path in policies:
-        check_attachment(root_id, policy_file_path, organizations)
-
-
-def make_migrations(role_arn: str, root_id: str) -> None:
-    with betterboto_client.CrossAccountClientContextManager(
-        "organizations", role_arn, f"organizations"
-    ) as organizations:
-        check_policies(root_id, organizations)
-        check_attachments(root_id, organizations)
+def check_attachments(root_id: str, snapshot: dict, index: dict = None) -> None:
+    if index is None:
+        index = environment_index.build_index(root_id)
+    remote_policies_by_target_id = get_remote_policies_by_target_id(snapshot)
+    for entity in index.get("by_path").values():
+        if entity.get("service_control_policies") is not None:
+            check_attachment(root_id, entity, remote_policies_by_target_id)
+
+
+def make_migrations(root_id: str, snapshot: dict, index: dict = None) -> None:
+    if index is None:
+        index = environment_index.build_index(root_id)
+    with metrics.phase(
+        metrics.MAKE_MIGRATIONS_CHECK, root_id=root_id, check="check_policies"
+    ):
+        check_policies(root_id, snapshot, index)
+    with metrics.phase(
+        metrics.MAKE_MIGRATIONS_CHECK, root_id=root_id, check="check_attachments"
+    ):
+        check_attachments(root_id, snapshot, index)
 
 
 def prune_metadata(root_id: str) -> None:
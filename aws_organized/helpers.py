@@ -7,11 +7,13 @@ from awacs import (
     aws,
     sts as awacs_sts,
     ssm as awscs_ssm,
+    dynamodb as awacs_dynamodb,
 )
 import pkg_resources
 from awacs.iam import ARN as IAM_ARN
 from troposphere import iam, s3, codebuild, codecommit, codepipeline, ssm
 from betterboto import client as betterboto_client
+from aws_organized import ledger
 
 
 def generate_role_template(
@@ -74,7 +76,9 @@ def generate_import_organization_role_template(
             awacs_organizations.ListRoots,
             awacs_organizations.ListPoliciesForTarget,
             awacs_organizations.ListAccounts,
+            awacs_organizations.DescribeAccount,
             awacs_organizations.ListChildren,
+            awacs_organizations.ListOrganizationalUnitsForParent,
             awacs_organizations.DescribeOrganizationalUnit,
             awacs_organizations.ListParents,
             awacs_organizations.ListPolicies,
@@ -115,8 +119,14 @@ def generate_make_migrations_role_template(
     return generate_role_template(
         "make-migrations",
         [
+            awacs_organizations.ListRoots,
+            awacs_organizations.ListAccounts,
+            awacs_organizations.ListChildren,
+            awacs_organizations.ListOrganizationalUnitsForParent,
             awacs_organizations.DescribeOrganizationalUnit,
             awacs_organizations.ListParents,
+            awacs_organizations.ListPolicies,
+            awacs_organizations.ListTargetsForPolicy,
             awacs_organizations.DescribePolicy,
             awacs_organizations.ListPoliciesForTarget,
             awacs_organizations.ListDelegatedServicesForAccount,
@@ -145,6 +155,7 @@ def generate_migrate_role_template(
     assuming_account_id: str,
     assuming_resource: str,
     ssm_parameter_prefix: str,
+    ledger_table: str = ledger.DEFAULT_LEDGER_TABLE,
 ) -> troposphere.Template:
     return generate_role_template(
         "migrate",
@@ -158,6 +169,12 @@ def generate_migrate_role_template(
             awacs_organizations.ListPolicies,
             awacs_organizations.RegisterDelegatedAdministrator,
             awacs_organizations.DeregisterDelegatedAdministrator,
+            awacs_organizations.ListRoots,
+            awacs_organizations.ListOrganizationalUnitsForParent,
+            awacs_organizations.ListParents,
+            awacs_organizations.DescribeOrganizationalUnit,
+            awacs_organizations.ListPoliciesForTarget,
+            awacs_organizations.ListDelegatedServicesForAccount,
         ],
         role_name,
         path,
@@ -169,19 +186,44 @@ def generate_migrate_role_template(
                 Effect=aws.Allow,
                 Action=[
                     awscs_ssm.GetParameter,
+                    awscs_ssm.GetParametersByPath,
                     awscs_ssm.PutParameter,
                     awscs_ssm.AddTagsToResource,
                 ],
                 Resource=[
+                    troposphere.Sub(
+                        awscs_ssm.ARN(
+                            resource=f"parameter{ssm_parameter_prefix}/migrations",
+                            account="${AWS::AccountId}",
+                            region="${AWS::Region}",
+                        )
+                    ),
                     troposphere.Sub(
                         awscs_ssm.ARN(
                             resource=f"parameter{ssm_parameter_prefix}/migrations/*",
                             account="${AWS::AccountId}",
                             region="${AWS::Region}",
                         )
-                    )
+                    ),
                 ],
-            )
+            ),
+            aws.Statement(
+                Sid="3",
+                Effect=aws.Allow,
+                Action=[
+                    awacs_dynamodb.Query,
+                    awacs_dynamodb.PutItem,
+                ],
+                Resource=[
+                    troposphere.Sub(
+                        awacs_dynamodb.ARN(
+                            resource=f"table/{ledger_table}",
+                            account="${AWS::AccountId}",
+                            region="${AWS::Region}",
+                        )
+                    ),
+                ],
+            ),
         ],
     )
 
@@ -192,9 +234,15 @@ def provision_migrate_role_stack(
     assuming_account_id: str,
     assuming_resource: str,
     ssm_parameter_prefix: str,
+    ledger_table: str = ledger.DEFAULT_LEDGER_TABLE,
 ) -> troposphere.Template:
     template = generate_migrate_role_template(
-        role_name, path, assuming_account_id, assuming_resource, ssm_parameter_prefix
+        role_name,
+        path,
+        assuming_account_id,
+        assuming_resource,
+        ssm_parameter_prefix,
+        ledger_table,
     )
     provision_stack("migrate-role", template)
     return template
@@ -0,0 +1,100 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+import json
+import os
+import threading
+from typing import Callable
+
+from aws_organized import state_store
+
+DEFAULT_JOURNAL_FILE = "migrate_journal.jsonl"
+
+# events written to the journal
+RUN = "run"
+STARTED = "started"
+FINISHED = "finished"
+
+
+def read_entries(journal_file: str) -> list:
+    """
+    Returns the entries in the journal.  A line that was only partly written when the run stopped is ignored.
+    """
+    entries = list()
+    if not os.path.exists(journal_file):
+        return entries
+    with open(journal_file, "r") as f:
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                continue
+    return entries
+
+
+def read_journal(journal_file: str, root_id: str) -> dict:
+    """
+    Returns what an earlier run for root_id that did not finish recorded, or None if there is no such run
+
+    :param journal_file:
+    :param root_id:
+    :return: dict of applied_migration_ids (read from the ledger when the run began), started and finished migration ids
+    """
+    result = None
+    for entry in read_entries(journal_file):
+        if entry.get("root_id") != root_id:
+            continue
+        event = entry.get("event")
+        if event == RUN:
+            result = dict(
+                applied_migration_ids=set(entry.get("applied_migration_ids")),
+                started=set(),
+                finished=set(),
+            )
+        elif result is not None and event == STARTED:
+            result.get("started").add(entry.get("migration_id"))
+        elif result is not None and event == FINISHED:
+            result.get("finished").add(entry.get("migration_id"))
+    return result
+
+
+def get_applied_migration_ids(previous_run: dict) -> set:
+    """
+    Returns the ids of the migrations a run carrying on from previous_run, as returned by read_journal, does not run
+    again: those in the ledger when previous_run began and those it finished
+    """
+    return previous_run.get("applied_migration_ids").union(previous_run.get("finished"))
+
+
+def get_writer(journal_file: str, root_id: str) -> Callable[..., None]:
+    """
+    Returns a function that appends an entry for root_id to the journal and waits for it to reach the disk, so the
+    journal is up to date whenever the run stops.  The function can be called from more than one thread.
+    """
+    lock = threading.Lock()
+
+    def write(event: str, **details) -> None:
+        entry = dict(root_id=root_id, event=event, **details)
+        with lock:
+            with open(journal_file, "a") as f:
+                f.write(json.dumps(entry) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    return write
+
+
+def clear(journal_file: str, root_id: str) -> None:
+    """
+    Removes the entries for root_id once its run has finished, removing the journal when nothing else is in it
+    """
+    entries = [
+        entry for entry in read_entries(journal_file) if entry.get("root_id") != root_id
+    ]
+    if len(entries) == 0:
+        if os.path.exists(journal_file):
+            os.remove(journal_file)
+    else:
+        state_store.write_file_atomically(
+            journal_file,
+            "".join(json.dumps(entry) + "\n" for entry in entries).encode(),
+        )
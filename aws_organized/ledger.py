@@ -0,0 +1,154 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+import json
+import os
+import threading
+from typing import Callable, Tuple
+
+from aws_organized import assumed_role, rate_limiter
+
+LEDGER_SSM = "ssm"
+LEDGER_FILE = "file"
+LEDGER_DYNAMODB = "dynamodb"
+LEDGERS = [LEDGER_SSM, LEDGER_FILE, LEDGER_DYNAMODB]
+DEFAULT_LEDGER = LEDGER_SSM
+
+DEFAULT_LEDGER_FILE = "migrations_ledger.jsonl"
+DEFAULT_LEDGER_TABLE = "AWS-Organized-migrations"
+
+# the ledger records which migrations have been run.  Each backend provides:
+#   read() -> set of the ids of the migrations already run
+#   record(migration_id, value, description) -> None
+Ledger = Tuple[Callable[[], set], Callable[[str, str, str], None]]
+
+
+def get_ssm_ledger(session, ssm_parameter_prefix: str, max_workers: int = 1) -> Ledger:
+    """
+    Records each migration as a parameter named {ssm_parameter_prefix}/migrations/{migration_id}
+    """
+    ssm = assumed_role.get_client(
+        session, "ssm", config=rate_limiter.get_client_config(max_workers)
+    )
+
+    def read() -> set:
+        migration_ids = set()
+        paginator = ssm.get_paginator("get_parameters_by_path")
+        for page in paginator.paginate(Path=f"{ssm_parameter_prefix}/migrations"):
+            for parameter in page.get("Parameters", []):
+                migration_ids.add(parameter.get("Name").split("/")[-1])
+        return migration_ids
+
+    def record(migration_id: str, value: str, description: str) -> None:
+        ssm.put_parameter(
+            Name=f"{ssm_parameter_prefix}/migrations/{migration_id}",
+            Description=description,
+            Value=value,
+            Type="String",
+            Tags=[
+                {"Key": "AWS-Organized:Actor", "Value": "Framework"},
+            ],
+        )
+
+    return read, record
+
+
+def get_file_ledger(ledger_file: str, ssm_parameter_prefix: str) -> Ledger:
+    """
+    Records each migration as a line of JSON appended to ledger_file.  ssm_parameter_prefix is recorded with each
+    migration so more than one environment can share a file.
+    """
+    lock = threading.Lock()
+
+    def read() -> set:
+        migration_ids = set()
+        if not os.path.exists(ledger_file):
+            return migration_ids
+        with open(ledger_file, "r") as f:
+            for line in f:
+                if line.strip() == "":
+                    continue
+                entry = json.loads(line)
+                if entry.get("prefix") == ssm_parameter_prefix:
+                    migration_ids.add(entry.get("migration_id"))
+        return migration_ids
+
+    def record(migration_id: str, value: str, description: str) -> None:
+        entry = dict(
+            prefix=ssm_parameter_prefix,
+            migration_id=migration_id,
+            value=value,
+            description=description,
+        )
+        with lock:
+            with open(ledger_file, "a") as f:
+                f.write(json.dumps(entry) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    return read, record
+
+
+def get_dynamodb_ledger(
+    session,
+    ledger_table: str,
+    ssm_parameter_prefix: str,
+    endpoint_url: str = None,
+    max_workers: int = 1,
+) -> Ledger:
+    """
+    Records each migration as an item in ledger_table, which needs a partition key named prefix and a sort key named
+    migration_id, both strings.  endpoint_url can point at a local stand-in such as DynamoDB Local.
+    """
+    kwargs = dict(config=rate_limiter.get_client_config(max_workers))
+    if endpoint_url is not None:
+        kwargs["endpoint_url"] = endpoint_url
+    dynamodb = assumed_role.get_client(session, "dynamodb", **kwargs)
+
+    def read() -> set:
+        migration_ids = set()
+        paginator = dynamodb.get_paginator("query")
+        for page in paginator.paginate(
+            TableName=ledger_table,
+            KeyConditionExpression="prefix = :prefix",
+            ExpressionAttributeValues={":prefix": dict(S=ssm_parameter_prefix)},
+            ProjectionExpression="migration_id",
+        ):
+            for item in page.get("Items", []):
+                migration_ids.add(item.get("migration_id").get("S"))
+        return migration_ids
+
+    def record(migration_id: str, value: str, description: str) -> None:
+        dynamodb.put_item(
+            TableName=ledger_table,
+            Item=dict(
+                prefix=dict(S=ssm_parameter_prefix),
+                migration_id=dict(S=migration_id),
+                value=dict(S=value),
+                description=dict(S=description),
+            ),
+        )
+
+    return read, record
+
+
+def get_ledger(
+    ledger_type: str,
+    session,
+    ssm_parameter_prefix: str,
+    ledger_file: str = DEFAULT_LEDGER_FILE,
+    ledger_table: str = DEFAULT_LEDGER_TABLE,
+    endpoint_url: str = None,
+    max_workers: int = 1,
+) -> Ledger:
+    """
+    max_workers is the number of threads that record migrations in the ledger at the same time
+    """
+    if ledger_type == LEDGER_SSM:
+        return get_ssm_ledger(session, ssm_parameter_prefix, max_workers)
+    elif ledger_type == LEDGER_FILE:
+        return get_file_ledger(ledger_file, ssm_parameter_prefix)
+    elif ledger_type == LEDGER_DYNAMODB:
+        return get_dynamodb_ledger(
+            session, ledger_table, ssm_parameter_prefix, endpoint_url, max_workers
+        )
+    raise Exception(f"Unknown ledger: {ledger_type}")
@@ -0,0 +1,150 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+import contextlib
+import json
+import threading
+import time
+from datetime import datetime
+
+import click
+
+# phases that are timed
+UPDATE_STATE = "update_state"
+REMOTE_SNAPSHOT = "remote_snapshot"
+SERVICE_CONTROL_POLICIES_IMPORT = "service_control_policies_import"
+DELEGATED_ADMINISTRATORS_IMPORT = "delegated_administrators_import"
+MAKE_MIGRATIONS_CHECK = "make_migrations_check"
+MIGRATION = "migration"
+
+# the file events are written to, None when metrics are off
+out = None
+lock = threading.Lock()
+# API calls made by all threads, and by the current thread, since metrics were turned on
+api_calls = 0
+local = threading.local()
+# totals by phase for the summary
+summary = dict()
+
+
+def start(metrics_out: str) -> None:
+    """
+    Turns metrics on, writing an event as JSON lines to metrics_out ("-" for stdout) as each phase finishes.  Clients
+    made from now on, and passed to add_call_counter, count their API calls.
+    """
+    global out, api_calls
+    out = click.open_file(metrics_out, "w")
+    api_calls = 0
+    summary.clear()
+
+
+def finish() -> None:
+    """
+    Writes an event with the totals for each phase, echoes them as a table to stderr, so they stay out of the JSON
+    lines when metrics_out is "-", and turns metrics off
+    """
+    global out
+    if out is None:
+        return
+    write(dict(event="summary", phases=summary, api_calls=api_calls))
+    click.echo(
+        f"{'Phase':<32} {'Runs':>6} {'Seconds':>10} {'Max':>10} {'API calls':>10}",
+        err=True,
+    )
+    for name, totals in summary.items():
+        click.echo(
+            f"{name:<32} {totals.get('runs'):>6} {totals.get('seconds'):>10.2f} "
+            f"{totals.get('max_seconds'):>10.2f} {totals.get('api_calls'):>10}",
+            err=True,
+        )
+    out.close()
+    out = None
+
+
+@contextlib.contextmanager
+def recording(metrics_out: str):
+    """
+    Records metrics while the block runs, unless metrics_out is None
+    """
+    if metrics_out is None:
+        yield
+        return
+    start(metrics_out)
+    try:
+        yield
+    finally:
+        finish()
+
+
+def write(event: dict) -> None:
+    with lock:
+        out.write(json.dumps(dict(time=datetime.utcnow().isoformat(), **event)) + "\n")
+        out.flush()
+
+
+def record_call(**kwargs) -> None:
+    global api_calls
+    with lock:
+        api_calls += 1
+    local.api_calls = getattr(local, "api_calls", 0) + 1
+
+
+def get_api_calls(per_thread: bool) -> int:
+    if per_thread:
+        return getattr(local, "api_calls", 0)
+    return api_calls
+
+
+def add_call_counter(client):
+    """
+    Counts the API calls the client makes.  Does nothing when metrics are off.
+
+    :param client: boto3 or betterboto client
+    :return: the client
+    """
+    if out is not None:
+        client.meta.events.register("before-call", record_call)
+    return client
+
+
+@contextlib.contextmanager
+def phase(name: str, per_thread: bool = False, **details):
+    """
+    Times the block and writes an event for it with the number of API calls made.  Yields a dict the block can add
+    details to.  Does nothing when metrics are off.
+
+    :param name: one of the phases above
+    :param per_thread: only count the API calls made by the current thread, for phases that run at the same time as
+    others
+    :param details: added to the event, eg the check or the migration id
+    """
+    event = dict(details)
+    if out is None:
+        yield event
+        return
+    api_calls_before = get_api_calls(per_thread)
+    started = time.monotonic()
+    try:
+        yield event
+    except Exception as e:
+        event["error"] = str(e)
+        raise
+    finally:
+        seconds = time.monotonic() - started
+        calls = get_api_calls(per_thread) - api_calls_before
+        with lock:
+            totals = summary.setdefault(
+                name, dict(runs=0, seconds=0.0, max_seconds=0.0, api_calls=0)
+            )
+            totals["runs"] += 1
+            totals["seconds"] += seconds
+            totals["max_seconds"] = max(totals["max_seconds"], seconds)
+            totals["api_calls"] += calls
+        write(
+            dict(
+                event="phase",
+                phase=name,
+                seconds=seconds,
+                api_calls=calls,
+                **event,
+            )
+        )
@@ -0,0 +1,212 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+import os
+import time
+from concurrent import futures
+from typing import Callable, Tuple
+
+from aws_organized import environment_index
+from aws_organized import migrations
+from aws_organized.extensions.service_control_policies import (
+    migrations as service_control_policies_migrations,
+)
+from aws_organized.extensions.delegated_administrators import (
+    migrations as delegated_administrators_migrations,
+)
+
+SEP = os.path.sep
+
+# kinds of resource a migration reads or changes
+OU_PATH = "OU_PATH"
+OU = "OU"
+ACCOUNT = "ACCOUNT"
+POLICY = "POLICY"
+POLICY_NAME = "POLICY_NAME"
+POLICY_ATTACHMENT = "POLICY_ATTACHMENT"
+DELEGATED_ADMINISTRATOR = "DELEGATED_ADMINISTRATOR"
+
+
+def get_ou_path_for_folder(folder: str) -> str:
+    parts = folder.split(SEP)[2:]
+    return "/" + "/".join(part for part in parts if part != "_organizational_units")
+
+
+def get_ou_paths_by_id(index: dict) -> dict:
+    """
+    Maps the Id of the root and of each OU in the environment to its path, eg /Workloads/Prod, as used by
+    convert_path_to_ou
+    """
+    ou_paths_by_id = dict()
+    for entity_type in [environment_index.ROOT, environment_index.ORGANIZATIONAL_UNIT]:
+        for entity in environment_index.get_entities(index, entity_type):
+            id = environment_index.get_id(entity)
+            if id is not None:
+                ou_paths_by_id[id] = get_ou_path_for_folder(entity.get("path"))
+    return ou_paths_by_id
+
+
+def join_path(parent_path: str, name: str) -> str:
+    return f"{parent_path.rstrip('/')}/{name}"
+
+
+def get_path_prefixes(path: str) -> list:
+    """
+    Returns the path of every OU convert_path_to_ou walks through to find path, eg /a, /a/b and /a/b/c for /a/b/c
+    """
+    prefixes = list()
+    prefix = ""
+    for part in path.split("/"):
+        if part != "":
+            prefix = f"{prefix}/{part}"
+            prefixes.append((OU_PATH, prefix))
+    return prefixes
+
+
+def get_resources(migration: dict, ou_paths_by_id: dict) -> Tuple[list, list]:
+    """
+    Returns the resources the migration reads and the resources it changes, or None if it is not known what the
+    migration touches
+
+    :param migration: dict with migration_type and migration_params
+    :param ou_paths_by_id: built by get_ou_paths_by_id
+    :return: (reads, writes)
+    """
+    migration_type = migration.get("migration_type")
+    params = migration.get("migration_params")
+    if migration_type == migrations.OU_CREATE:
+        writes = list()
+        parent_path = ou_paths_by_id.get(params.get("parent_id"))
+        if parent_path is not None:
+            writes.append((OU_PATH, join_path(parent_path, params.get("name"))))
+        return list(), writes
+    elif migration_type == migrations.OU_CREATE_WITH_NON_EXISTENT_PARENT_OU:
+        path = join_path(params.get("parent_ou_path"), params.get("name"))
+        return get_path_prefixes(params.get("parent_ou_path")), [(OU_PATH, path)]
+    elif migration_type == migrations.OU_RENAME:
+        writes = [(OU, params.get("organizational_unit_id"))]
+        path = ou_paths_by_id.get(params.get("organizational_unit_id"))
+        if path is not None:
+            writes.append((OU_PATH, path))
+        return list(), writes
+    elif migration_type == migrations.ACCOUNT_MOVE:
+        return list(), [(ACCOUNT, params.get("account_id"))]
+    elif migration_type == migrations.ACCOUNT_MOVE_WITH_NON_EXISTENT_PARENT_OU:
+        return get_path_prefixes(params.get("destination_path")), [
+            (ACCOUNT, params.get("account_id"))
+        ]
+    elif migration_type == service_control_policies_migrations.POLICY_CREATE:
+        return list(), [(POLICY_NAME, params.get("name"))]
+    elif migration_type == service_control_policies_migrations.POLICY_DETAILS_UPDATE:
+        return list(), [(POLICY, params.get("id")), (POLICY_NAME, params.get("name"))]
+    elif migration_type == service_control_policies_migrations.POLICY_CONTENT_UPDATE:
+        return list(), [(POLICY, params.get("id"))]
+    elif migration_type == service_control_policies_migrations.POLICY_ATTACH:
+        return [(POLICY_NAME, params.get("policy_name"))], [
+            (POLICY_ATTACHMENT, params.get("policy_name"), params.get("target_id"))
+        ]
+    elif migration_type in [
+        delegated_administrators_migrations.REGISTER_DELEGATED_ADMINISTRATOR,
+        delegated_administrators_migrations.DEREGISTER_DELEGATED_ADMINISTRATOR,
+    ]:
+        return list(), [
+            (
+                DELEGATED_ADMINISTRATOR,
+                params.get("account_id"),
+                params.get("service_principal"),
+            )
+        ]
+    return None
+
+
+def get_dependencies(migrations_to_run: list, ou_paths_by_id: dict) -> list:
+    """
+    Works out which of the earlier migrations each migration has to wait for.  A migration waits for every earlier
+    migration that changes a resource it reads or changes and for every earlier migration that reads a resource it
+    changes, eg an ACCOUNT_MOVE_WITH_NON_EXISTENT_PARENT_OU into /a/b waits for the OU_CREATE of /a and /a/b and a
+    POLICY_ATTACH waits for the POLICY_CREATE of the policy.  A migration whose resources are not known waits for, and
+    is waited for by, every other migration.
+
+    :param migrations_to_run: in the order they would be run one at a time
+    :param ou_paths_by_id: built by get_ou_paths_by_id
+    :return: list of the set of indexes of the migrations each migration waits for
+    """
+    dependencies = list()
+    earlier_readers = dict()
+    earlier_writers = dict()
+    last_barrier = None
+    for i, migration in enumerate(migrations_to_run):
+        resources = get_resources(migration, ou_paths_by_id)
+        if resources is None:
+            dependencies.append(set(range(i)))
+            last_barrier = i
+            continue
+        reads, writes = resources
+        depends_on = set()
+        if last_barrier is not None:
+            depends_on.add(last_barrier)
+        for resource in reads:
+            depends_on.update(earlier_writers.get(resource, set()))
+        for resource in writes:
+            depends_on.update(earlier_writers.get(resource, set()))
+            depends_on.update(earlier_readers.get(resource, set()))
+        for resource in reads:
+            earlier_readers.setdefault(resource, set()).add(i)
+        for resource in writes:
+            earlier_writers.setdefault(resource, set()).add(i)
+        dependencies.append(depends_on)
+    return dependencies
+
+
+def run_migrations(
+    migrations_to_run: list,
+    run_migration: Callable[[dict], Tuple[bool, str]],
+    on_complete: Callable[[dict, bool, str], None],
+    ou_paths_by_id: dict,
+    max_workers: int,
+    deadline: float = None,
+) -> int:
+    """
+    Runs the migrations using a pool of max_workers threads, starting each one as soon as the migrations it depends on
+    (see get_dependencies) have finished.  A migration still runs when a migration it depends on fails, as it would
+    have done when run one at a time.  Once the deadline has passed no more migrations are started and the ones
+    running are left to finish.
+
+    :param migrations_to_run: in the order they would be run one at a time
+    :param run_migration: runs a migration and returns (result, message)
+    :param on_complete: called, from the calling thread, with the migration, result and message as each finishes
+    :param ou_paths_by_id: built by get_ou_paths_by_id
+    :param max_workers:
+    :param deadline: time.monotonic() after which no more migrations are started, or None to run them all
+    :return: the number of migrations not run because the deadline passed
+    """
+    dependencies = get_dependencies(migrations_to_run, ou_paths_by_id)
+    dependants = [list() for _ in migrations_to_run]
+    for i, depends_on in enumerate(dependencies):
+        for j in depends_on:
+            dependants[j].append(i)
+    waiting_for = [len(depends_on) for depends_on in dependencies]
+
+    with futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        running = dict()
+        not_started = list()
+
+        def start(i: int) -> None:
+            if deadline is not None and time.monotonic() >= deadline:
+                not_started.append(i)
+            else:
+                running[executor.submit(run_migration, migrations_to_run[i])] = i
+
+        for i, count in enumerate(waiting_for):
+            if count == 0:
+                start(i)
+        while running:
+            done, _ = futures.wait(running.keys(), return_when=futures.FIRST_COMPLETED)
+            for future in sorted(done, key=lambda f: running[f]):
+                i = running.pop(future)
+                result, message = future.result()
+                on_complete(migrations_to_run[i], result, message)
+                for j in dependants[i]:
+                    waiting_for[j] -= 1
+                    if waiting_for[j] == 0:
+                        start(j)
+    return len(not_started) + len([count for count in waiting_for if count > 0])
@@ -0,0 +1,202 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+import math
+import types
+from typing import Tuple
+
+from aws_organized import ledger
+from aws_organized import migrations
+from aws_organized import migration_executor
+from aws_organized import ou_path_cache
+from aws_organized import preconditions
+from aws_organized.extensions.service_control_policies import (
+    migrations as service_control_policies_migrations,
+)
+
+# used to estimate how long the migrations will take, override them to match the limits of your account
+DEFAULT_ORGANIZATIONS_CALLS_PER_SECOND = 2.0
+DEFAULT_LEDGER_CALLS_PER_SECOND = 3.0
+SECONDS_PER_CALL = 0.25
+
+SSM_PARAMETERS_PER_PAGE = 10
+
+# calls made by each migration type, not counting looking up the path of an OU
+ORGANIZATIONS_CALLS = {
+    migrations.OU_CREATE: 1,
+    migrations.OU_CREATE_WITH_NON_EXISTENT_PARENT_OU: 1,
+    migrations.OU_RENAME: 1,
+    migrations.ACCOUNT_MOVE: 1,
+    migrations.ACCOUNT_MOVE_WITH_NON_EXISTENT_PARENT_OU: 1,
+    service_control_policies_migrations.POLICY_CREATE: 1,
+    service_control_policies_migrations.POLICY_DETAILS_UPDATE: 1,
+    service_control_policies_migrations.POLICY_CONTENT_UPDATE: 1,
+    service_control_policies_migrations.POLICY_ATTACH: 2,
+}
+DEFAULT_ORGANIZATIONS_CALLS = 1
+
+
+def get_path_lookup_calls(path: str) -> int:
+    """
+    Returns the number of calls convert_path_to_ou makes to find path, one ListRoots and one
+    ListOrganizationalUnitsForParent for each part of the path
+    """
+    return 1 + len([part for part in path.split("/") if part != ""])
+
+
+def make_planning_client(lookup_calls: list):
+    """
+    Makes a stand in for the organizations client that makes no calls.  convert_path_to_ou adds the calls it would make
+    to lookup_calls, a list of one number, and the OUs it finds or creates get made up Ids.  Wrapped by
+    ou_path_cache.add_ou_path_cache it finds paths in the same way as the client migrate uses.
+    """
+    created = list()
+
+    def convert_path_to_ou(path: str) -> str:
+        lookup_calls[0] += get_path_lookup_calls(path)
+        return f"planned:{path}"
+
+    def create_organizational_unit(ParentId: str, Name: str) -> dict:
+        created.append(Name)
+        return dict(OrganizationalUnit=dict(Id=f"planned-ou-{len(created)}"))
+
+    def update_organizational_unit(**kwargs) -> dict:
+        return dict()
+
+    return types.SimpleNamespace(
+        convert_path_to_ou=convert_path_to_ou,
+        create_organizational_unit=create_organizational_unit,
+        update_organizational_unit=update_organizational_unit,
+    )
+
+
+def get_organizations_calls(
+    migration: dict, planning_client, lookup_calls: list
+) -> int:
+    """
+    Returns the number of AWS Organizations calls the migration will make.  The OUs the migration looks up, creates
+    and renames are passed to planning_client so the paths it looks up are only counted when they are not cached
+    (see ou_path_cache).
+
+    :param migration: dict with migration_type and migration_params
+    :param planning_client: made by make_planning_client and wrapped by ou_path_cache.add_ou_path_cache
+    :param lookup_calls: the list of one number planning_client was made with
+    :return: number of calls
+    """
+    migration_type = migration.get("migration_type")
+    params = migration.get("migration_params")
+    calls = ORGANIZATIONS_CALLS.get(migration_type, DEFAULT_ORGANIZATIONS_CALLS)
+    lookup_calls[0] = 0
+    if migration_type == migrations.OU_CREATE:
+        planning_client.create_organizational_unit(
+            ParentId=params.get("parent_id"), Name=params.get("name")
+        )
+    elif migration_type == migrations.OU_CREATE_WITH_NON_EXISTENT_PARENT_OU:
+        parent_id = planning_client.convert_path_to_ou(params.get("parent_ou_path"))
+        planning_client.create_organizational_unit(
+            ParentId=parent_id, Name=params.get("name")
+        )
+    elif migration_type == migrations.OU_RENAME:
+        planning_client.update_organizational_unit(
+            OrganizationalUnitId=params.get("organizational_unit_id"),
+            Name=params.get("name"),
+        )
+    elif migration_type == migrations.ACCOUNT_MOVE_WITH_NON_EXISTENT_PARENT_OU:
+        planning_client.convert_path_to_ou(params.get("destination_path"))
+    return calls + lookup_calls[0]
+
+
+def get_ledger_calls(
+    ledger_type: str, number_of_migrations_run: int, number_of_migrations_to_run: int
+) -> Tuple[int, int]:
+    """
+    Returns the number of calls made to read the ledger and the number made to record the migrations to run
+    """
+    if ledger_type == ledger.LEDGER_SSM:
+        reads = max(1, math.ceil(number_of_migrations_run / SSM_PARAMETERS_PER_PAGE))
+        return reads, number_of_migrations_to_run
+    elif ledger_type == ledger.LEDGER_DYNAMODB:
+        return 1, number_of_migrations_to_run
+    return 0, 0
+
+
+def get_steps(dependencies: list) -> list:
+    """
+    Groups the migrations into steps.  The migrations in a step only depend on migrations in earlier steps so can run
+    at the same time.
+
+    :param dependencies: built by migration_executor.get_dependencies
+    :return: list of lists of indexes of migrations
+    """
+    step_for_migration = list()
+    steps = list()
+    for depends_on in dependencies:
+        step = 1 + max([step_for_migration[j] for j in depends_on], default=-1)
+        step_for_migration.append(step)
+        if step == len(steps):
+            steps.append(list())
+        steps[step].append(len(step_for_migration) - 1)
+    return steps
+
+
+def make_plan(
+    migrations_to_run: list,
+    ou_paths_by_id: dict,
+    ou_ids_by_path: dict,
+    check_preconditions: bool = True,
+) -> Tuple[list, list]:
+    """
+    Works out the order the migrations will be run in and the AWS Organizations calls each will make, without making
+    any calls.  The dependencies and the OU paths are worked out as migrate works them out: the dependencies from the
+    environment and the paths from a cache seeded from the state and kept up to date as the migrations run.
+
+    :param migrations_to_run: in the order they would be run one at a time
+    :param ou_paths_by_id: built by migration_executor.get_ou_paths_by_id
+    :param ou_ids_by_path: built by ou_path_cache.get_ou_ids_by_path, used to seed the cache
+    :param check_preconditions: count the call made to check each migration is not already applied
+    :return: (steps, calls) where steps is built by get_steps and calls is the number of calls for each migration
+    """
+    dependencies = migration_executor.get_dependencies(
+        migrations_to_run, ou_paths_by_id
+    )
+    steps = get_steps(dependencies)
+    lookup_calls = [0]
+    planning_client = ou_path_cache.add_ou_path_cache(
+        make_planning_client(lookup_calls), ou_ids_by_path
+    )
+    calls = [0] * len(migrations_to_run)
+    for step in steps:
+        for i in step:
+            migration = migrations_to_run[i]
+            calls[i] = get_organizations_calls(migration, planning_client, lookup_calls)
+            if (
+                check_preconditions
+                and migration.get("migration_type")
+                in preconditions.CHECKED_MIGRATION_TYPES
+            ):
+                calls[i] += 1
+    return steps, calls
+
+
+def get_estimated_seconds(
+    steps: list,
+    calls: list,
+    ledger_calls: int,
+    max_workers: int,
+    organizations_calls_per_second: float,
+    ledger_calls_per_second: float,
+) -> float:
+    """
+    Estimates how long the migrations will take.  This is the longer of the time the calls take when made as soon as
+    they can be, assuming each takes SECONDS_PER_CALL, and the time it takes to make them at the given rates.
+    """
+    seconds_waiting_for_calls = 0.0
+    for step in steps:
+        rounds = math.ceil(len(step) / max_workers)
+        seconds_waiting_for_calls += (
+            rounds * max([calls[i] for i in step]) * SECONDS_PER_CALL
+        )
+    seconds_at_rate = max(
+        sum(calls) / organizations_calls_per_second,
+        ledger_calls / ledger_calls_per_second,
+    )
+    return max(seconds_waiting_for_calls, seconds_at_rate)
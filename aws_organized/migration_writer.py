@@ -0,0 +1,245 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+import contextlib
+import decimal
+import hashlib
+import os
+import threading
+import uuid
+
+import yaml
+
+from aws_organized import state_store
+
+SEP = os.path.sep
+ID_WIDTH = 12
+BATCH_ID_WIDTH = 12
+MANIFEST_FILE_NAME = "_migrations_manifest.yaml"
+# what the manifest records about each migration file, on top of the migration itself
+MANIFEST_KEYS = ["content_hash", "size", "mtime_ns"]
+
+# migrations waiting to be written, by root_id, while a buffered block is running
+buffers = dict()
+lock = threading.Lock()
+
+
+def get_migrations_directory(root_id: str) -> str:
+    return SEP.join(["environment", root_id, "_migrations"])
+
+
+def get_manifest_file(root_id: str) -> str:
+    return SEP.join(["environment", root_id, MANIFEST_FILE_NAME])
+
+
+def get_migration_number(migration_id: str) -> decimal.Decimal:
+    """
+    Returns the number at the start of the migration id.  This is a sequence number or, for migrations made before
+    sequence numbers were used, a timestamp.
+    """
+    return decimal.Decimal(migration_id.split("_")[0])
+
+
+def get_migration_ids(root_id: str) -> list:
+    """
+    Returns the ids of the migrations in the _migrations directory in the order they were made
+    """
+    directory = get_migrations_directory(root_id)
+    if not os.path.exists(directory):
+        return list()
+    migration_ids = [
+        migration_file.replace(".yaml", "") for migration_file in os.listdir(directory)
+    ]
+    return sorted(
+        migration_ids,
+        key=lambda migration_id: (get_migration_number(migration_id), migration_id),
+    )
+
+
+def get_migration_file(root_id: str, migration_id: str) -> str:
+    return SEP.join([get_migrations_directory(root_id), f"{migration_id}.yaml"])
+
+
+def get_migration_file_stats(root_id: str) -> dict:
+    """
+    Returns the size and modification time of each migration file by migration id, from one listing of the _migrations
+    directory
+    """
+    directory = get_migrations_directory(root_id)
+    if not os.path.exists(directory):
+        return dict()
+    stats = dict()
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            stat = entry.stat()
+            stats[entry.name.replace(".yaml", "")] = dict(
+                size=stat.st_size, mtime_ns=stat.st_mtime_ns
+            )
+    return stats
+
+
+def get_content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def read_migration_content(root_id: str, migration_id: str) -> str:
+    with open(get_migration_file(root_id, migration_id), "r") as f:
+        return f.read()
+
+
+def read_migration(root_id: str, migration_id: str) -> dict:
+    return yaml.safe_load(read_migration_content(root_id, migration_id))
+
+
+def read_manifest(root_id: str) -> dict:
+    """
+    Returns the migrations in the manifest by id, or None if there is no manifest or it does not match the
+    _migrations directory, eg because a migration was added, removed or changed after the manifest was written.  The
+    manifest is checked against one listing of the directory: only the files whose size or modification time differ
+    from the manifest, eg because git checked them out again, are read and checked against the hash of their content.
+    """
+    manifest_file = get_manifest_file(root_id)
+    if not os.path.exists(manifest_file):
+        return None
+    with open(manifest_file, "r") as f:
+        manifest = yaml.safe_load(f.read())
+    migrations = {
+        migration.get("migration_id"): migration
+        for migration in manifest.get("migrations", [])
+    }
+    stats = get_migration_file_stats(root_id)
+    if set(migrations.keys()) != set(stats.keys()):
+        return None
+    for migration_id, migration in migrations.items():
+        stat = stats.get(migration_id)
+        if all(migration.get(key) == value for key, value in stat.items()):
+            continue
+        content = read_migration_content(root_id, migration_id)
+        if migration.get("content_hash") != get_content_hash(content):
+            return None
+        migration.update(stat)
+    return migrations
+
+
+def get_migration_from_manifest(manifest: dict, migration_id: str) -> dict:
+    """
+    Returns a copy of the migration in the manifest returned by read_manifest, without what the manifest records
+    about its file
+    """
+    migration = dict(manifest.get(migration_id))
+    for key in MANIFEST_KEYS:
+        migration.pop(key, None)
+    return migration
+
+
+def get_manifest_entry(
+    root_id: str, migration: dict, migration_id: str, content: str
+) -> dict:
+    stat = os.stat(get_migration_file(root_id, migration_id))
+    return dict(
+        migration,
+        migration_id=migration_id,
+        content_hash=get_content_hash(content),
+        size=stat.st_size,
+        mtime_ns=stat.st_mtime_ns,
+    )
+
+
+def write_manifest(root_id: str, migrations: list) -> None:
+    state_store.write_file_atomically(
+        get_manifest_file(root_id),
+        yaml.safe_dump(dict(migrations=migrations)).encode(),
+    )
+
+
+def write_migrations(
+    root_id: str, migrations_to_write: list, with_manifest: bool = False
+) -> None:
+    """
+    Writes each migration to its own file in the _migrations directory.  The ids start with sequence numbers, zero
+    padded so they sort in the order the migrations were made, carrying on from the highest number already used.  The
+    sequence numbers start again if the _migrations directory is pruned, so the ids also hold a random batch id,
+    shared by the migrations written together, that keeps them apart from the ids of migrations already recorded in
+    the ledger.
+
+    :param root_id:
+    :param migrations_to_write: dicts of extension, migration_type and migration_params
+    :param with_manifest: also write a manifest of every migration in the _migrations directory
+    """
+    directory = get_migrations_directory(root_id)
+    os.makedirs(directory, exist_ok=True)
+    with lock:
+        existing_migration_ids = get_migration_ids(root_id)
+        if with_manifest:
+            manifest = read_manifest(root_id)
+            migrations = list()
+            for migration_id in existing_migration_ids:
+                if manifest is not None:
+                    migration = manifest.get(migration_id)
+                else:
+                    content = read_migration_content(root_id, migration_id)
+                    migration = get_manifest_entry(
+                        root_id, yaml.safe_load(content), migration_id, content
+                    )
+                migrations.append(migration)
+        sequence = 1 + max(
+            [
+                int(get_migration_number(migration_id))
+                for migration_id in existing_migration_ids
+            ],
+            default=0,
+        )
+        batch_id = uuid.uuid4().hex[:BATCH_ID_WIDTH]
+        for migration in migrations_to_write:
+            migration_id = (
+                f"{sequence:0{ID_WIDTH}d}_{batch_id}_{migration.get('migration_type')}"
+            )
+            sequence += 1
+            content = yaml.safe_dump(migration)
+            with open(get_migration_file(root_id, migration_id), "x") as f:
+                f.write(content)
+            if with_manifest:
+                migrations.append(
+                    get_manifest_entry(root_id, migration, migration_id, content)
+                )
+        if with_manifest:
+            write_manifest(root_id, migrations)
+
+
+def write_migration(
+    extension: str, root_id: str, migration_type: str, migration_params: dict
+) -> None:
+    """
+    Writes the migration, or adds it to the buffer when called inside buffered(root_id)
+    """
+    migration = dict(
+        extension=extension,
+        migration_type=migration_type,
+        migration_params=migration_params,
+    )
+    with lock:
+        if root_id in buffers:
+            buffers[root_id].append(migration)
+            return
+    write_migrations(root_id, [migration])
+
+
+@contextlib.contextmanager
+def buffered(root_id: str, with_manifest: bool = False):
+    """
+    Holds the migrations written for root_id inside the block and writes them all when the block finishes.  Nothing is
+    written if the block raises an exception.
+
+    :param root_id:
+    :param with_manifest: see write_migrations
+    """
+    with lock:
+        buffers[root_id] = list()
+    try:
+        yield
+    except BaseException:
+        with lock:
+            buffers.pop(root_id)
+        raise
+    with lock:
+        migrations_to_write = buffers.pop(root_id)
+    write_migrations(root_id, migrations_to_write, with_manifest)
@@ -30,7 +30,7 @@ def ou_create_with_non_existent_parent_ou(
 ) -> MigrationResult:
     try:
         parent_id = client.convert_path_to_ou(parent_ou_path)
-        return ou_create(client=client, name=name, parent_id=parent_id)
+        return ou_create(root_id=root_id, client=client, name=name, parent_id=parent_id)
     except botocore.exceptions.ClientError as error:
         message = error.response["Error"]["Message"]
         return False, message
@@ -83,6 +83,7 @@ def account_move_with_non_existent_parent_ou(
     try:
         destination_parent_id = client.convert_path_to_ou(destination_path)
         return account_move(
+            root_id=root_id,
             client=client,
             account_id=account_id,
             destination_parent_id=destination_parent_id,
@@ -0,0 +1,78 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+import threading
+
+
+def get_ou_ids_by_path(root_id: str, state: dict) -> dict:
+    """
+    Returns the Id of the root and of each OU recorded in the state, keyed by path eg /Workloads/Prod, as used by
+    convert_path_to_ou.  Nothing is returned when there is no state or the state is for another root.
+
+    :param root_id:
+    :param state: as written by import-organization
+    :return: dict of path to Id
+    """
+    if state is None:
+        return dict()
+    by_name = state.get("organizational_units", dict()).get("by_name", dict())
+    if by_name.get("/") != root_id:
+        return dict()
+    return dict(by_name)
+
+
+def add_ou_path_cache(organizations, ou_ids_by_path: dict):
+    """
+    Makes convert_path_to_ou on the organizations client look up the path in a cache before walking the organization.
+    The cache starts with ou_ids_by_path, remembers each path convert_path_to_ou walks and is kept up to date as OUs
+    are created and renamed using the client.  The client can still be shared between threads.
+
+    :param organizations: betterboto organizations client
+    :param ou_ids_by_path: built by get_ou_ids_by_path
+    :return: the organizations client
+    """
+    lock = threading.Lock()
+    ou_ids_by_path = dict(ou_ids_by_path)
+    ou_paths_by_id = {id: path for path, id in ou_ids_by_path.items()}
+    convert_path_to_ou = organizations.convert_path_to_ou
+    create_organizational_unit = organizations.create_organizational_unit
+    update_organizational_unit = organizations.update_organizational_unit
+
+    def remember(path: str, id: str) -> None:
+        with lock:
+            ou_ids_by_path[path] = id
+            ou_paths_by_id[id] = path
+
+    def cached_convert_path_to_ou(path: str) -> str:
+        id = ou_ids_by_path.get(path)
+        if id is None:
+            id = convert_path_to_ou(path)
+            remember(path, id)
+        return id
+
+    def cached_create_organizational_unit(**kwargs) -> dict:
+        response = create_organizational_unit(**kwargs)
+        parent_path = ou_paths_by_id.get(kwargs.get("ParentId"))
+        if parent_path is not None:
+            remember(
+                f"{parent_path.rstrip('/')}/{kwargs.get('Name')}",
+                response.get("OrganizationalUnit").get("Id"),
+            )
+        return response
+
+    def cached_update_organizational_unit(**kwargs) -> dict:
+        response = update_organizational_unit(**kwargs)
+        with lock:
+            old_path = ou_paths_by_id.get(kwargs.get("OrganizationalUnitId"))
+            if old_path is not None and kwargs.get("Name") is not None:
+                new_path = "/".join(old_path.split("/")[:-1] + [kwargs.get("Name")])
+                for path in list(ou_ids_by_path.keys()):
+                    if path == old_path or path.startswith(f"{old_path}/"):
+                        id = ou_ids_by_path.pop(path)
+                        ou_ids_by_path[new_path + path[len(old_path) :]] = id
+                        ou_paths_by_id[id] = new_path + path[len(old_path) :]
+        return response
+
+    organizations.convert_path_to_ou = cached_convert_path_to_ou
+    organizations.create_organizational_unit = cached_create_organizational_unit
+    organizations.update_organizational_unit = cached_update_organizational_unit
+    return organizations
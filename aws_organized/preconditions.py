@@ -0,0 +1,273 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+import threading
+from typing import Callable
+
+from botocore import exceptions as botocore_exceptions
+
+from aws_organized import migrations
+from aws_organized.extensions.service_control_policies import (
+    migrations as service_control_policies_migrations,
+)
+from aws_organized.extensions.delegated_administrators import (
+    migrations as delegated_administrators_migrations,
+)
+
+ALREADY_APPLIED = "Already applied"
+
+# migration types is_already_applied can check, each check makes at most one call
+CHECKED_MIGRATION_TYPES = [
+    migrations.OU_CREATE,
+    migrations.OU_CREATE_WITH_NON_EXISTENT_PARENT_OU,
+    migrations.OU_RENAME,
+    migrations.ACCOUNT_MOVE,
+    migrations.ACCOUNT_MOVE_WITH_NON_EXISTENT_PARENT_OU,
+    service_control_policies_migrations.POLICY_CREATE,
+    service_control_policies_migrations.POLICY_ATTACH,
+    delegated_administrators_migrations.REGISTER_DELEGATED_ADMINISTRATOR,
+    delegated_administrators_migrations.DEREGISTER_DELEGATED_ADMINISTRATOR,
+]
+
+# errors that show the change a migration makes is not in place yet, eg the parent of the OU it creates does not exist
+NOT_FOUND_ERROR_CODES = [
+    "AccountNotFoundException",
+    "ChildNotFoundException",
+    "OrganizationalUnitNotFoundException",
+    "ParentNotFoundException",
+    "PolicyNotFoundException",
+    "TargetNotFoundException",
+]
+# betterboto's convert_path_to_ou raises an Exception with this message when there is no OU at the path
+PATH_NOT_FOUND_MESSAGE = "not found"
+
+# kinds of remote resource cached while checking preconditions
+CHILDREN = "CHILDREN"
+PARENT = "PARENT"
+ORGANIZATIONAL_UNIT = "ORGANIZATIONAL_UNIT"
+POLICIES = "POLICIES"
+POLICIES_FOR_TARGET = "POLICIES_FOR_TARGET"
+DELEGATED_SERVICES = "DELEGATED_SERVICES"
+
+
+def make_snapshot() -> dict:
+    """
+    Makes an empty snapshot of the remote resources the preconditions look at.  Resources are fetched the first time
+    a precondition needs them and kept for the rest of the run, see get_cached and forget.
+    """
+    return dict(lock=threading.Lock(), resources=dict(), generations=dict())
+
+
+def get_cached(snapshot: dict, kind: str, key: str, fetch: Callable[[], object]):
+    """
+    Returns the cached resource, fetching it if it is not cached.  A resource forgotten while it was being fetched is
+    not cached as what was fetched may be out of date.
+    """
+    with snapshot.get("lock"):
+        resources = snapshot.get("resources").setdefault(kind, dict())
+        if key in resources:
+            return resources.get(key)
+        generation = snapshot.get("generations").get(kind, 0)
+    value = fetch()
+    with snapshot.get("lock"):
+        if snapshot.get("generations").get(kind, 0) == generation:
+            snapshot.get("resources").get(kind)[key] = value
+    return value
+
+
+def forget(snapshot: dict, kind: str, key: str = None) -> None:
+    """
+    Forgets the cached resource, or every cached resource of the kind when key is None
+    """
+    with snapshot.get("lock"):
+        generations = snapshot.get("generations")
+        generations[kind] = generations.get(kind, 0) + 1
+        resources = snapshot.get("resources").get(kind, dict())
+        if key is None:
+            resources.clear()
+        elif key in resources:
+            del resources[key]
+
+
+def get_children_names(organizations, snapshot: dict, parent_id: str) -> list:
+    return get_cached(
+        snapshot,
+        CHILDREN,
+        parent_id,
+        lambda: [
+            child.get("Name")
+            for child in organizations.list_organizational_units_for_parent_single_page(
+                ParentId=parent_id
+            ).get("OrganizationalUnits", [])
+        ],
+    )
+
+
+def get_parent_id(organizations, snapshot: dict, account_id: str) -> str:
+    return get_cached(
+        snapshot,
+        PARENT,
+        account_id,
+        lambda: organizations.list_parents_single_page(ChildId=account_id)
+        .get("Parents")[0]
+        .get("Id"),
+    )
+
+
+def get_policy_names(organizations, snapshot: dict) -> list:
+    return get_cached(
+        snapshot,
+        POLICIES,
+        "SERVICE_CONTROL_POLICY",
+        lambda: [
+            policy.get("Name")
+            for policy in organizations.list_policies_single_page(
+                Filter="SERVICE_CONTROL_POLICY"
+            ).get("Policies", [])
+        ],
+    )
+
+
+def get_policy_names_for_target(organizations, snapshot: dict, target_id: str) -> list:
+    return get_cached(
+        snapshot,
+        POLICIES_FOR_TARGET,
+        target_id,
+        lambda: [
+            policy.get("Name")
+            for policy in organizations.list_policies_for_target_single_page(
+                TargetId=target_id, Filter="SERVICE_CONTROL_POLICY"
+            ).get("Policies", [])
+        ],
+    )
+
+
+def get_delegated_service_principals(
+    organizations, snapshot: dict, account_id: str
+) -> list:
+    def fetch() -> list:
+        try:
+            delegated_services = (
+                organizations.list_delegated_services_for_account_single_page(
+                    AccountId=account_id
+                ).get("DelegatedServices", [])
+            )
+        except organizations.exceptions.AccountNotRegisteredException:
+            delegated_services = list()
+        return [
+            delegated_service.get("ServicePrincipal")
+            for delegated_service in delegated_services
+        ]
+
+    return get_cached(snapshot, DELEGATED_SERVICES, account_id, fetch)
+
+
+def is_not_found(error: Exception) -> bool:
+    """
+    Returns True if the error raised while checking a migration only shows its change is not in place yet
+    """
+    if isinstance(error, botocore_exceptions.ClientError):
+        return error.response.get("Error", dict()).get("Code") in NOT_FOUND_ERROR_CODES
+    return type(error) is Exception and str(error) == PATH_NOT_FOUND_MESSAGE
+
+
+def is_already_applied(organizations, snapshot: dict, migration: dict) -> bool:
+    """
+    Checks whether the change the migration makes is already in place, eg because the migration ran before but was
+    not recorded in the ledger.  Only read calls are made and what they return is cached in the snapshot.  Migrations
+    that cannot be checked are never already applied.  Errors are raised, see is_not_found for the ones that only show
+    the change is not in place.
+
+    :param organizations: organizations client
+    :param snapshot: made by make_snapshot
+    :param migration: dict with migration_type and migration_params
+    :return: True if running the migration would not change anything
+    """
+    migration_type = migration.get("migration_type")
+    params = migration.get("migration_params")
+    if migration_type == migrations.OU_CREATE:
+        return params.get("name") in get_children_names(
+            organizations, snapshot, params.get("parent_id")
+        )
+    elif migration_type == migrations.OU_CREATE_WITH_NON_EXISTENT_PARENT_OU:
+        parent_id = organizations.convert_path_to_ou(params.get("parent_ou_path"))
+        return params.get("name") in get_children_names(
+            organizations, snapshot, parent_id
+        )
+    elif migration_type == migrations.OU_RENAME:
+        organizational_unit_id = params.get("organizational_unit_id")
+        name = get_cached(
+            snapshot,
+            ORGANIZATIONAL_UNIT,
+            organizational_unit_id,
+            lambda: organizations.describe_organizational_unit(
+                OrganizationalUnitId=organizational_unit_id
+            )
+            .get("OrganizationalUnit")
+            .get("Name"),
+        )
+        return name == params.get("name")
+    elif migration_type == migrations.ACCOUNT_MOVE:
+        return params.get("destination_parent_id") == get_parent_id(
+            organizations, snapshot, params.get("account_id")
+        )
+    elif migration_type == migrations.ACCOUNT_MOVE_WITH_NON_EXISTENT_PARENT_OU:
+        destination_parent_id = organizations.convert_path_to_ou(
+            params.get("destination_path")
+        )
+        return destination_parent_id == get_parent_id(
+            organizations, snapshot, params.get("account_id")
+        )
+    elif migration_type == service_control_policies_migrations.POLICY_CREATE:
+        return params.get("name") in get_policy_names(organizations, snapshot)
+    elif migration_type == service_control_policies_migrations.POLICY_ATTACH:
+        return params.get("policy_name") in get_policy_names_for_target(
+            organizations, snapshot, params.get("target_id")
+        )
+    elif (
+        migration_type
+        == delegated_administrators_migrations.REGISTER_DELEGATED_ADMINISTRATOR
+    ):
+        return params.get("service_principal") in get_delegated_service_principals(
+            organizations, snapshot, params.get("account_id")
+        )
+    elif (
+        migration_type
+        == delegated_administrators_migrations.DEREGISTER_DELEGATED_ADMINISTRATOR
+    ):
+        return params.get("service_principal") not in get_delegated_service_principals(
+            organizations, snapshot, params.get("account_id")
+        )
+    return False
+
+
+def forget_changed(snapshot: dict, migration: dict) -> None:
+    """
+    Forgets the cached resources the migration changed so later preconditions fetch them again
+    """
+    migration_type = migration.get("migration_type")
+    params = migration.get("migration_params")
+    if migration_type == migrations.OU_CREATE:
+        forget(snapshot, CHILDREN, params.get("parent_id"))
+    elif migration_type == migrations.OU_CREATE_WITH_NON_EXISTENT_PARENT_OU:
+        forget(snapshot, CHILDREN)
+    elif migration_type == migrations.OU_RENAME:
+        forget(snapshot, ORGANIZATIONAL_UNIT, params.get("organizational_unit_id"))
+        forget(snapshot, CHILDREN)
+    elif migration_type in [
+        migrations.ACCOUNT_MOVE,
+        migrations.ACCOUNT_MOVE_WITH_NON_EXISTENT_PARENT_OU,
+    ]:
+        forget(snapshot, PARENT, params.get("account_id"))
+    elif migration_type in [
+        service_control_policies_migrations.POLICY_CREATE,
+        service_control_policies_migrations.POLICY_DETAILS_UPDATE,
+    ]:
+        forget(snapshot, POLICIES)
+        forget(snapshot, POLICIES_FOR_TARGET)
+    elif migration_type == service_control_policies_migrations.POLICY_ATTACH:
+        forget(snapshot, POLICIES_FOR_TARGET, params.get("target_id"))
+    elif migration_type in [
+        delegated_administrators_migrations.REGISTER_DELEGATED_ADMINISTRATOR,
+        delegated_administrators_migrations.DEREGISTER_DELEGATED_ADMINISTRATOR,
+    ]:
+        forget(snapshot, DELEGATED_SERVICES, params.get("account_id"))
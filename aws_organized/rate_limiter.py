@@ -0,0 +1,186 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+import collections
+import random
+import threading
+import time
+
+from botocore import config as botocore_config
+
+DEFAULT_MAX_POOL_CONNECTIONS = 10
+MAX_ATTEMPTS = 10
+
+THROTTLING_ERROR_CODES = [
+    "Throttling",
+    "ThrottlingException",
+    "ThrottledException",
+    "TooManyRequestsException",
+    "RequestLimitExceeded",
+    "RequestThrottled",
+    "RequestThrottledException",
+    "ProvisionedThroughputExceededException",
+]
+
+# errors botocore does not retry but that go away when the call is made again, eg AWS Organizations refuses calls that
+# change an entity while another call is changing it.  These are retried after a random delay of up to
+# CONCURRENT_MODIFICATION_BACKOFF_SECONDS * 2 ** attempts, capped at MAX_CONCURRENT_MODIFICATION_BACKOFF_SECONDS
+CONCURRENT_MODIFICATION_ERROR_CODES = [
+    "ConcurrentModificationException",
+]
+CONCURRENT_MODIFICATION_BACKOFF_SECONDS = 0.5
+MAX_CONCURRENT_MODIFICATION_BACKOFF_SECONDS = 20.0
+
+MIN_CALLS_PER_SECOND = 0.5
+MAX_CALLS_PER_SECOND = 100.0
+# when throttled the rate is multiplied by BACKOFF, at most once every BACKOFF_SECONDS so calls throttled at the same
+# time only slow things down once.  Each second without throttling the rate goes up by RATE_INCREASE
+BACKOFF = 0.7
+BACKOFF_SECONDS = 0.5
+RATE_INCREASE = 0.5
+
+buckets = dict()
+buckets_lock = threading.Lock()
+
+
+def get_client_config(max_workers: int) -> botocore_config.Config:
+    """
+    Config for clients shared by max_workers threads.  Throttled calls are retried by botocore and add_rate_limiter
+    slows down the calls made by every client of the service.
+    """
+    return botocore_config.Config(
+        max_pool_connections=max(max_workers, DEFAULT_MAX_POOL_CONNECTIONS),
+        retries=dict(mode="standard", max_attempts=MAX_ATTEMPTS),
+    )
+
+
+def get_bucket(service_name: str) -> dict:
+    """
+    Returns the token bucket shared by all clients of the service.  The bucket has no rate, so calls are not limited,
+    until a call is throttled.
+    """
+    with buckets_lock:
+        if service_name not in buckets:
+            buckets[service_name] = dict(
+                lock=threading.Lock(),
+                rate=None,
+                tokens=0.0,
+                last_refilled=time.monotonic(),
+                last_throttled=None,
+                sent=collections.deque(),
+            )
+        return buckets[service_name]
+
+
+def record_sent(bucket: dict, now: float) -> None:
+    sent = bucket.get("sent")
+    sent.append(now)
+    while sent[0] < now - 1.0:
+        sent.popleft()
+
+
+def get_measured_rate(bucket: dict, now: float) -> float:
+    """
+    Returns the number of calls sent in the last second
+    """
+    return float(len([t for t in bucket.get("sent") if t >= now - 1.0]))
+
+
+def acquire(bucket: dict) -> None:
+    """
+    Waits until the bucket has a token for a call and takes it
+    """
+    while True:
+        with bucket.get("lock"):
+            now = time.monotonic()
+            rate = bucket.get("rate")
+            if rate is None:
+                record_sent(bucket, now)
+                return
+            capacity = max(1.0, rate)
+            bucket["tokens"] = min(
+                capacity, bucket["tokens"] + (now - bucket["last_refilled"]) * rate
+            )
+            bucket["last_refilled"] = now
+            if bucket["tokens"] >= 1.0:
+                bucket["tokens"] -= 1.0
+                record_sent(bucket, now)
+                return
+            wait = (1.0 - bucket["tokens"]) / rate
+        time.sleep(wait)
+
+
+def on_throttled(bucket: dict) -> None:
+    with bucket.get("lock"):
+        now = time.monotonic()
+        last_throttled = bucket.get("last_throttled")
+        if last_throttled is not None and now - last_throttled < BACKOFF_SECONDS:
+            return
+        bucket["last_throttled"] = now
+        rate = bucket.get("rate")
+        if rate is None:
+            rate = get_measured_rate(bucket, now)
+        bucket["rate"] = max(MIN_CALLS_PER_SECOND, rate * BACKOFF)
+        bucket["tokens"] = min(bucket["tokens"], 0.0)
+
+
+def on_success(bucket: dict) -> None:
+    with bucket.get("lock"):
+        rate = bucket.get("rate")
+        if rate is not None:
+            bucket["rate"] = min(MAX_CALLS_PER_SECOND, rate + RATE_INCREASE / rate)
+
+
+def get_error_code(response) -> str:
+    if response is None:
+        return None
+    _, parsed = response
+    return parsed.get("Error", dict()).get("Code")
+
+
+def is_throttled(response) -> bool:
+    return get_error_code(response) in THROTTLING_ERROR_CODES
+
+
+def get_concurrent_modification_delay(response, attempts: int) -> float:
+    """
+    Returns how long to wait before retrying a call refused because of a concurrent modification, or None if the call
+    should not be retried
+    """
+    if get_error_code(response) not in CONCURRENT_MODIFICATION_ERROR_CODES:
+        return None
+    if attempts >= MAX_ATTEMPTS:
+        return None
+    return random.uniform(
+        0,
+        min(
+            MAX_CONCURRENT_MODIFICATION_BACKOFF_SECONDS,
+            CONCURRENT_MODIFICATION_BACKOFF_SECONDS * 2**attempts,
+        ),
+    )
+
+
+def add_rate_limiter(client):
+    """
+    Makes every call the client sends, including retries, wait for a token from the bucket shared by all clients of the
+    same service.  The rate of the bucket adapts to the responses: it is cut each time a call is throttled and creeps
+    back up while calls succeed.  Calls refused because of a concurrent modification, which happen when migrations run
+    at the same time, are retried with a backoff.
+
+    :param client: boto3 or betterboto client
+    :return: the client
+    """
+    bucket = get_bucket(client.meta.service_model.service_name)
+
+    def before_send(**kwargs):
+        acquire(bucket)
+
+    def needs_retry(response=None, attempts: int = 1, **kwargs):
+        if is_throttled(response):
+            on_throttled(bucket)
+        elif response is not None:
+            on_success(bucket)
+        return get_concurrent_modification_delay(response, attempts)
+
+    client.meta.events.register("before-send", before_send)
+    client.meta.events.register("needs-retry", needs_retry)
+    return client
@@ -0,0 +1,135 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+import os
+import json
+import uuid
+from datetime import datetime
+
+import yaml
+
+try:
+    from yaml import CSafeLoader as SafeLoader, CSafeDumper as SafeDumper
+except ImportError:
+    from yaml import SafeLoader, SafeDumper
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+STATE_FORMAT_YAML = "yaml"
+STATE_FORMAT_JSON = "json"
+STATE_FORMAT_MSGPACK = "msgpack"
+STATE_FORMATS = [STATE_FORMAT_YAML, STATE_FORMAT_JSON, STATE_FORMAT_MSGPACK]
+DEFAULT_STATE_FORMAT = STATE_FORMAT_YAML
+
+STATE_FILES = {
+    STATE_FORMAT_YAML: "state.yaml",
+    STATE_FORMAT_JSON: "state.json",
+    STATE_FORMAT_MSGPACK: "state.msgpack",
+}
+
+# json and msgpack have no timestamp type so datetimes (eg JoinedTimestamp of accounts) are written as tagged objects
+DATETIME_TAG = "__datetime__"
+
+
+def encode_datetime(value):
+    if isinstance(value, datetime):
+        return {DATETIME_TAG: value.isoformat()}
+    raise TypeError(f"Cannot serialise {type(value)}")
+
+
+def decode_datetime(value: dict):
+    if len(value) == 1 and DATETIME_TAG in value:
+        return datetime.fromisoformat(value.get(DATETIME_TAG))
+    return value
+
+
+def dump_yaml(state: dict) -> bytes:
+    return yaml.dump(state, Dumper=SafeDumper, encoding="utf-8")
+
+
+def load_yaml(content: bytes) -> dict:
+    return yaml.load(content, Loader=SafeLoader)
+
+
+def dump_json(state: dict) -> bytes:
+    return json.dumps(state, default=encode_datetime).encode("utf-8")
+
+
+def load_json(content: bytes) -> dict:
+    return json.loads(content, object_hook=decode_datetime)
+
+
+def dump_msgpack(state: dict) -> bytes:
+    return msgpack.packb(state, default=encode_datetime, use_bin_type=True)
+
+
+def load_msgpack(content: bytes) -> dict:
+    return msgpack.unpackb(content, object_hook=decode_datetime, raw=False)
+
+
+def get_serialiser(state_format: str) -> tuple:
+    if state_format == STATE_FORMAT_YAML:
+        return dump_yaml, load_yaml
+    elif state_format == STATE_FORMAT_JSON:
+        return dump_json, load_json
+    elif state_format == STATE_FORMAT_MSGPACK:
+        if msgpack is None:
+            raise Exception(
+                "The msgpack state format needs msgpack: pip install aws-organized[msgpack]"
+            )
+        return dump_msgpack, load_msgpack
+    raise Exception(f"Unknown state format: {state_format}")
+
+
+def get_state_file(state_format: str = DEFAULT_STATE_FORMAT) -> str:
+    return STATE_FILES.get(state_format)
+
+
+def write_file_atomically(path: str, content: bytes) -> None:
+    """
+    Writes content to a temporary file in the same directory and renames it over path so readers never see a
+    partially written file
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    temporary_path = os.path.join(
+        directory, f".{os.path.basename(path)}.{uuid.uuid4().hex}"
+    )
+    # os.open applies the umask to the mode, so the file gets the same permissions open() would give it
+    file_descriptor = os.open(
+        temporary_path,
+        os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0),
+        0o666,
+    )
+    try:
+        with os.fdopen(file_descriptor, "wb") as f:
+            f.write(content)
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.remove(temporary_path)
+        raise
+
+
+def write_state(state: dict, state_format: str = DEFAULT_STATE_FORMAT) -> None:
+    dump, _ = get_serialiser(state_format)
+    write_file_atomically(get_state_file(state_format), dump(state))
+
+
+def get_state_format_for_file(state_file: str) -> str:
+    for state_format, file_name in STATE_FILES.items():
+        if state_file.endswith(os.path.splitext(file_name)[1]):
+            return state_format
+    raise Exception(f"Cannot tell the state format of {state_file}")
+
+
+def read_state_file(state_file: str, state_format: str) -> dict:
+    _, load = get_serialiser(state_format)
+    if not os.path.exists(state_file):
+        return None
+    with open(state_file, "rb") as f:
+        return load(f.read())
+
+
+def read_state(state_format: str = DEFAULT_STATE_FORMAT) -> dict:
+    return read_state_file(get_state_file(state_format), state_format)
@@ -22,6 +22,9 @@ install_requires = \
  'progress>=1.5,<2.0',
  'troposphere==3.1.0']
 
+extras_require = \
+{'msgpack': ['msgpack>=1.0,<2.0']}
+
 entry_points = \
 {'console_scripts': ['aws-organized = aws_organized.cli:cli']}
 
@@ -39,6 +42,7 @@ setup_kwargs = {
     'packages': packages,
     'package_data': package_data,
     'install_requires': install_requires,
+    'extras_require': extras_require,
     'entry_points': entry_points,
     'python_requires': '>=3.7,<4',
 }
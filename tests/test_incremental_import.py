@@ -0,0 +1,35 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+from aws_organized import aws_organized
+
+
+def test_parents_not_in_the_change_feed_are_reused():
+    previous = dict(organizational_units=dict(), account_ids=[], fingerprint="f")
+
+    assert (
+        aws_organized.get_crawl_strategy("ou-a", previous, {"ou-b"})
+        == aws_organized.CRAWL_STRATEGY_REUSE
+    )
+    assert (
+        aws_organized.get_crawl_strategy("ou-b", previous, {"ou-b"})
+        == aws_organized.CRAWL_STRATEGY_FETCH
+    )
+    assert (
+        aws_organized.get_crawl_strategy("ou-a", None, {"ou-b"})
+        == aws_organized.CRAWL_STRATEGY_FETCH
+    )
+
+
+def test_reused_policy_targets_get_the_names_found_by_the_import():
+    target = dict(TargetId="ou-a", Name="Alpha", Type="ORGANIZATIONAL_UNIT")
+    attachment_index = aws_organized.invert_policy_attachments(
+        {"p-1": dict(details=dict(Id="p-1"), targets=[target])}
+    )
+    by_id = {"ou-a": dict(path="/Renamed", details=dict(Id="ou-a", Name="Renamed"))}
+
+    aws_organized.refresh_policy_target_names(attachment_index, by_id, dict())
+
+    assert attachment_index.get("by_policy_id").get("p-1").get("targets") == [
+        dict(TargetId="ou-a", Name="Renamed", Type="ORGANIZATIONAL_UNIT")
+    ]
+    assert target.get("Name") == "Alpha"
@@ -0,0 +1,139 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+from aws_organized import migration_executor
+from aws_organized import migrations
+from aws_organized.extensions.service_control_policies import (
+    migrations as service_control_policies_migrations,
+)
+
+OU_PATHS_BY_ID = {"r-1": "/", "ou-a": "/a"}
+
+
+def make_migration(migration_type: str, **migration_params) -> dict:
+    return dict(migration_type=migration_type, migration_params=migration_params)
+
+
+def test_child_create_waits_for_parent_create():
+    migrations_to_run = [
+        make_migration(migrations.OU_CREATE, name="b", parent_id="ou-a"),
+        make_migration(
+            migrations.OU_CREATE_WITH_NON_EXISTENT_PARENT_OU,
+            name="c",
+            parent_ou_path="/a/b",
+        ),
+        make_migration(
+            migrations.OU_CREATE_WITH_NON_EXISTENT_PARENT_OU,
+            name="d",
+            parent_ou_path="/a/b/c",
+        ),
+    ]
+
+    dependencies = migration_executor.get_dependencies(
+        migrations_to_run, OU_PATHS_BY_ID
+    )
+
+    assert dependencies == [set(), {0}, {0, 1}]
+
+
+def test_account_move_waits_for_destination_create():
+    migrations_to_run = [
+        make_migration(migrations.OU_CREATE, name="b", parent_id="ou-a"),
+        make_migration(
+            migrations.ACCOUNT_MOVE_WITH_NON_EXISTENT_PARENT_OU,
+            account_id="111",
+            destination_path="/a/b",
+            source_parent_id="r-1",
+        ),
+        make_migration(
+            migrations.ACCOUNT_MOVE,
+            account_id="222",
+            destination_parent_id="ou-a",
+            source_parent_id="r-1",
+        ),
+    ]
+
+    dependencies = migration_executor.get_dependencies(
+        migrations_to_run, OU_PATHS_BY_ID
+    )
+
+    assert dependencies == [set(), {0}, set()]
+
+
+def test_moves_of_the_same_account_run_in_order():
+    migrations_to_run = [
+        make_migration(
+            migrations.ACCOUNT_MOVE,
+            account_id="111",
+            destination_parent_id="ou-a",
+            source_parent_id="r-1",
+        ),
+        make_migration(
+            migrations.ACCOUNT_MOVE,
+            account_id="111",
+            destination_parent_id="r-1",
+            source_parent_id="ou-a",
+        ),
+    ]
+
+    dependencies = migration_executor.get_dependencies(
+        migrations_to_run, OU_PATHS_BY_ID
+    )
+
+    assert dependencies == [set(), {0}]
+
+
+def test_rename_waits_for_creates_below_the_old_path():
+    migrations_to_run = [
+        make_migration(
+            migrations.OU_CREATE_WITH_NON_EXISTENT_PARENT_OU,
+            name="b",
+            parent_ou_path="/a",
+        ),
+        make_migration(migrations.OU_RENAME, name="z", organizational_unit_id="ou-a"),
+    ]
+
+    dependencies = migration_executor.get_dependencies(
+        migrations_to_run, OU_PATHS_BY_ID
+    )
+
+    assert dependencies == [set(), {0}]
+
+
+def test_policy_attach_waits_for_policy_create():
+    migrations_to_run = [
+        make_migration(
+            service_control_policies_migrations.POLICY_CREATE, name="p", content="{}"
+        ),
+        make_migration(
+            service_control_policies_migrations.POLICY_ATTACH,
+            policy_name="p",
+            target_id="ou-a",
+        ),
+        make_migration(
+            service_control_policies_migrations.POLICY_ATTACH,
+            policy_name="q",
+            target_id="ou-a",
+        ),
+    ]
+
+    dependencies = migration_executor.get_dependencies(
+        migrations_to_run, OU_PATHS_BY_ID
+    )
+
+    assert dependencies == [set(), {0}, set()]
+
+
+def test_unknown_migration_type_is_a_barrier():
+    migrations_to_run = [
+        make_migration(migrations.OU_CREATE, name="b", parent_id="ou-a"),
+        make_migration(migrations.OU_CREATE, name="c", parent_id="ou-a"),
+        make_migration("UNKNOWN"),
+        make_migration(migrations.OU_CREATE, name="d", parent_id="ou-a"),
+        make_migration(migrations.OU_CREATE, name="e", parent_id="ou-a"),
+    ]
+
+    dependencies = migration_executor.get_dependencies(
+        migrations_to_run, OU_PATHS_BY_ID
+    )
+
+    assert dependencies == [set(), set(), {0, 1}, {2}, {2}]
@@ -0,0 +1,52 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+from aws_organized import migration_plan
+from aws_organized import migrations
+
+
+def test_independent_migrations_share_a_step():
+    assert migration_plan.get_steps([set(), set(), set()]) == [[0, 1, 2]]
+
+
+def test_migration_runs_in_the_step_after_its_last_dependency():
+    dependencies = [set(), {0}, set(), {1, 2}, {0}]
+
+    assert migration_plan.get_steps(dependencies) == [[0, 2], [1, 4], [3]]
+
+
+def test_barrier_splits_the_steps():
+    dependencies = [set(), set(), {0, 1}, {2}, {2}]
+
+    assert migration_plan.get_steps(dependencies) == [[0, 1], [2], [3, 4]]
+
+
+def test_paths_renamed_or_created_by_earlier_migrations_are_not_looked_up():
+    migrations_to_run = [
+        dict(
+            migration_type=migrations.OU_RENAME,
+            migration_params=dict(organizational_unit_id="ou-a", name="AlphaX"),
+        ),
+        dict(
+            migration_type=migrations.OU_CREATE,
+            migration_params=dict(parent_id="ou-a", name="New"),
+        ),
+        dict(
+            migration_type=migrations.OU_CREATE_WITH_NON_EXISTENT_PARENT_OU,
+            migration_params=dict(parent_ou_path="/AlphaX/New", name="Sub"),
+        ),
+        dict(
+            migration_type=migrations.ACCOUNT_MOVE_WITH_NON_EXISTENT_PARENT_OU,
+            migration_params=dict(
+                account_id="111", source_parent_id="r-1", destination_path="/Beta/Gamma"
+            ),
+        ),
+    ]
+
+    steps, calls = migration_plan.make_plan(
+        migrations_to_run,
+        {"r-1": "/", "ou-a": "/AlphaX"},
+        {"/": "r-1", "/Alpha": "ou-a"},
+        check_preconditions=False,
+    )
+
+    assert calls == [1, 1, 1, 1 + migration_plan.get_path_lookup_calls("/Beta/Gamma")]
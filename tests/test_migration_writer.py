@@ -0,0 +1,75 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+import os
+import shutil
+
+import pytest
+
+from aws_organized import migration_writer
+
+ROOT_ID = "r-1"
+
+
+def make_migration(name: str) -> dict:
+    return dict(
+        extension="aws_organized",
+        migration_type="OU_CREATE",
+        migration_params=dict(name=name, parent_ou_path="/"),
+    )
+
+
+@pytest.fixture
+def environment(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    migration_writer.write_migrations(
+        ROOT_ID, [make_migration("a"), make_migration("b")], with_manifest=True
+    )
+
+
+def test_manifest_is_read_without_reading_the_migrations(environment, monkeypatch):
+    def read_migration_content(root_id, migration_id):
+        raise AssertionError(f"{migration_id} was read")
+
+    monkeypatch.setattr(
+        migration_writer, "read_migration_content", read_migration_content
+    )
+
+    manifest = migration_writer.read_manifest(ROOT_ID)
+
+    migration_ids = migration_writer.get_migration_ids(ROOT_ID)
+    assert [
+        migration_writer.get_migration_from_manifest(manifest, migration_id)
+        for migration_id in migration_ids
+    ] == [
+        dict(make_migration("a"), migration_id=migration_ids[0]),
+        dict(make_migration("b"), migration_id=migration_ids[1]),
+    ]
+
+
+def test_manifest_survives_a_checkout(environment):
+    migration_id = migration_writer.get_migration_ids(ROOT_ID)[0]
+    migration_file = migration_writer.get_migration_file(ROOT_ID, migration_id)
+    stat = os.stat(migration_file)
+    os.utime(migration_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    assert migration_writer.read_manifest(ROOT_ID) is not None
+
+
+def test_manifest_is_ignored_once_a_migration_is_edited(environment):
+    migration_id = migration_writer.get_migration_ids(ROOT_ID)[0]
+    migration_file = migration_writer.get_migration_file(ROOT_ID, migration_id)
+    with open(migration_file, "a") as f:
+        f.write("# edited\n")
+
+    assert migration_writer.read_manifest(ROOT_ID) is None
+
+
+def test_ids_are_not_reused_once_the_migrations_are_pruned(environment):
+    applied_migration_ids = set(migration_writer.get_migration_ids(ROOT_ID))
+    shutil.rmtree(migration_writer.get_migrations_directory(ROOT_ID))
+
+    migration_writer.write_migrations(ROOT_ID, [make_migration("c")])
+
+    migration_ids = migration_writer.get_migration_ids(ROOT_ID)
+    assert len(migration_ids) == 1
+    assert migration_ids[0] not in applied_migration_ids
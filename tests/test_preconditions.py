@@ -0,0 +1,22 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+from botocore import exceptions as botocore_exceptions
+
+from aws_organized import preconditions
+
+
+def make_client_error(code: str) -> botocore_exceptions.ClientError:
+    return botocore_exceptions.ClientError(
+        dict(Error=dict(Code=code, Message=code)), "ListChildren"
+    )
+
+
+def test_missing_parents_only_show_the_change_is_not_in_place():
+    assert preconditions.is_not_found(make_client_error("ParentNotFoundException"))
+    assert preconditions.is_not_found(Exception(preconditions.PATH_NOT_FOUND_MESSAGE))
+
+
+def test_other_errors_are_real_failures():
+    assert not preconditions.is_not_found(make_client_error("AccessDeniedException"))
+    assert not preconditions.is_not_found(make_client_error("TooManyRequestsException"))
+    assert not preconditions.is_not_found(KeyError("name"))
@@ -0,0 +1,43 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+from aws_organized import rate_limiter
+
+
+def make_response(code: str) -> tuple:
+    return None, dict(Error=dict(Code=code))
+
+
+def test_concurrent_modification_is_retried_with_backoff():
+    response = make_response("ConcurrentModificationException")
+
+    for attempts in range(1, rate_limiter.MAX_ATTEMPTS):
+        delay = rate_limiter.get_concurrent_modification_delay(response, attempts)
+        assert (
+            0
+            <= delay
+            <= min(
+                rate_limiter.MAX_CONCURRENT_MODIFICATION_BACKOFF_SECONDS,
+                rate_limiter.CONCURRENT_MODIFICATION_BACKOFF_SECONDS * 2**attempts,
+            )
+        )
+
+
+def test_concurrent_modification_gives_up_after_max_attempts():
+    response = make_response("ConcurrentModificationException")
+
+    assert (
+        rate_limiter.get_concurrent_modification_delay(
+            response, rate_limiter.MAX_ATTEMPTS
+        )
+        is None
+    )
+
+
+def test_other_errors_are_left_to_botocore():
+    assert rate_limiter.get_concurrent_modification_delay(None, 1) is None
+    assert (
+        rate_limiter.get_concurrent_modification_delay(
+            make_response("DuplicateOrganizationalUnitException"), 1
+        )
+        is None
+    )